@@ -0,0 +1,139 @@
+"""
+מדידת קצב ההמרה (עמודים לשנייה) עבור הגדרות OCR שונות
+
+הפעלה:
+    python -m app.benchmark doc1.pdf doc2.pdf --languages "" he,en --dpi "" 96 adaptive
+
+ערך ריק ("") מייצג את ברירת המחדל של Marker. השורה הראשונה בטבלה היא הבסיס להשוואה.
+
+השוואת פרופילי הסקה (דיוק מלא מול int8 על המעבד):
+    INFERENCE_PROFILE=cpu WORKER_POOL_SIZE=1 python -m app.benchmark doc1.pdf --profiles default cpu \
+        --quantize layout_model recognition_model
+
+--quantize מקוונטז את המודלים בפרופיל cpu בלי בדיקת הדיוק של QUANTIZED_MODELS, כדי שהטבלה תראה
+גם את הסטייה של מודלים שהבדיקה הייתה פוסלת. בלי --quantize פרופיל cpu משתמש ב-QUANTIZED_MODELS
+(ברירת המחדל ריקה - אז שני הפרופילים מריצים את אותם מודלים בדיוק מלא).
+
+סטיית הדיוק נמדדת כדמיון בין הטקסט של כל פרופיל לטקסט של הפרופיל הראשון (1.0 = זהה).
+העמודה int8 מציגה את המודלים שרצו בפועל ב-int8.
+"""
+import argparse
+import itertools
+import os
+import time
+
+from app.services.cpu_profile import (
+    apply_inference_profile,
+    quantize_predictor,
+    quantized_models,
+    text_similarity,
+)
+from app.services.document_processor import marker_ocr_only_convert, marker_standard_convert
+from app.services.model_registry import get_model_dict
+
+
+def count_pages(file_path: str) -> int:
+    if os.path.splitext(file_path)[1].lower() != ".pdf":
+        return 1
+    import pypdfium2 as pdfium
+
+    pdf = pdfium.PdfDocument(file_path)
+    try:
+        return len(pdf)
+    finally:
+        pdf.close()
+
+
+def run_variant(files, ocr_languages, dpi, repeat: int) -> float:
+    """
+    Returns:
+        float: עמודים לשנייה עבור ההגדרה הנתונה
+    """
+    pages = 0
+    elapsed = 0.0
+    for _ in range(repeat):
+        for file_path in files:
+            start = time.perf_counter()
+            marker_ocr_only_convert(file_path=file_path, ocr_languages=ocr_languages, dpi=dpi)
+            elapsed += time.perf_counter() - start
+            pages += count_pages(file_path)
+    return pages / elapsed if elapsed else 0.0
+
+
+def run_profile(files, profile: str, mode: str, repeat: int):
+    """
+    Returns:
+        (float, dict): עמודים לשנייה, והטקסט שהתקבל לכל קובץ
+    """
+    convert = marker_ocr_only_convert if mode == "ocr" else marker_standard_convert
+    # המרה ראשונה לחימום - טעינת המודלים (והקוונטיזציה) לא נספרת במדידה
+    convert(file_path=files[0], profile=profile)
+
+    pages = 0
+    elapsed = 0.0
+    texts = {}
+    for _ in range(repeat):
+        for file_path in files:
+            start = time.perf_counter()
+            texts[file_path] = convert(file_path=file_path, profile=profile)
+            elapsed += time.perf_counter() - start
+            pages += count_pages(file_path)
+    return (pages / elapsed if elapsed else 0.0), texts
+
+
+def compare_profiles(files, profiles, mode: str, repeat: int, quantize=None):
+    baseline_rate = None
+    baseline_texts = None
+    print(f"{'profile':<12}{'pages/sec':>12}{'speedup':>10}{'similarity':>12}  int8")
+    for profile in profiles:
+        if profile == "cpu" and quantize:
+            # קוונטיזציה ללא בדיקת דיוק - המודלים מקוונטזים במקום, לפני בניית ה-converter
+            model_dict = get_model_dict(profile)
+            for name in quantize:
+                quantize_predictor(model_dict, name)
+        pages_per_sec, texts = run_profile(files, profile, mode, repeat)
+        if baseline_rate is None:
+            baseline_rate, baseline_texts = pages_per_sec, texts
+        speedup = pages_per_sec / baseline_rate if baseline_rate else 0.0
+        similarity = min(
+            text_similarity(baseline_texts[f], texts[f])
+            for f in files
+        )
+        int8 = ", ".join(quantized_models(get_model_dict(profile))) or "-"
+        print(f"{profile:<12}{pages_per_sec:>12.2f}{speedup:>9.2f}x{similarity:>12.4f}  {int8}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="מדידת קצב המרה עם OCR לפי שפות ו-DPI")
+    parser.add_argument("files", nargs="+", help="קבצים למדידה")
+    parser.add_argument("--languages", nargs="+", default=["", "he,en"], help="רשימות שפות להשוואה")
+    parser.add_argument("--dpi", nargs="+", default=["", "96", "adaptive"], help="ערכי DPI להשוואה")
+    parser.add_argument("--repeat", type=int, default=1, help="מספר חזרות לכל הגדרה")
+    parser.add_argument("--profiles", nargs="+", help="השוואת פרופילי הסקה (default, cpu) במקום שפות ו-DPI")
+    parser.add_argument("--mode", default="ocr", choices=["ocr", "standard"], help="סוג ההמרה להשוואת פרופילים")
+    parser.add_argument("--quantize", nargs="+", help="מודלים לקוונטיזציה בפרופיל cpu, ללא בדיקת הדיוק")
+    args = parser.parse_args()
+    if args.quantize and "cpu" not in (args.profiles or []):
+        parser.error("--quantize דורש --profiles עם cpu")
+
+    apply_inference_profile()
+
+    if args.profiles:
+        compare_profiles(args.files, args.profiles, args.mode, args.repeat, args.quantize)
+        return
+
+    # המרה ראשונה לחימום - טעינת המודלים לא נספרת במדידה
+    marker_ocr_only_convert(file_path=args.files[0])
+
+    baseline = None
+    print(f"{'languages':<15}{'dpi':<12}{'pages/sec':>12}{'speedup':>10}")
+    for languages, dpi in itertools.product(args.languages, args.dpi):
+        pages_per_sec = run_variant(args.files, languages or None, dpi or None, args.repeat)
+        if baseline is None:
+            baseline = pages_per_sec
+        speedup = pages_per_sec / baseline if baseline else 0.0
+        print(f"{languages or 'default':<15}{dpi or 'default':<12}{pages_per_sec:>12.2f}{speedup:>9.2f}x")
+
+
+if __name__ == "__main__":
+    main()
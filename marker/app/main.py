@@ -1,5 +1,13 @@
 from fastapi import FastAPI
 from app.routes import document_processing
+from app.services.task_queue import get_task_queue
+
+# Conversions run in this process only without a task queue; otherwise the workers
+# load torch and apply the inference profile (INFERENCE_PROFILE) themselves
+if get_task_queue() is None:
+    from app.services.cpu_profile import apply_inference_profile
+
+    apply_inference_profile()
 
 app = FastAPI()
 
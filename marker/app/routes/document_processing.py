@@ -1,10 +1,19 @@
 from fastapi import APIRouter, UploadFile, File, HTTPException, Form, Query, Request
-from fastapi.responses import JSONResponse, FileResponse
+from fastapi.responses import JSONResponse, FileResponse, Response
 import tempfile
 import os
 import shutil
 from typing import Optional
-from app.services.document_processor import marker_standard_convert, marker_ocr_only_convert, marker_with_gpt_convert
+from urllib.parse import quote
+from app.services.document_processor import convert_document
+from app.services.image_store import (
+    IMAGE_POLICIES,
+    build_bundle,
+    create_bundle_dir,
+    get_image_path,
+    validate_image_policy,
+)
+from app.services.render_settings import parse_dpi, parse_languages
 
 router = APIRouter(
     prefix="/documents",
@@ -25,6 +34,62 @@ async def health_check():
     """
     return {"status": "ok", "message": "שירות עיבוד המסמכים פעיל ורץ"}
 
+@router.get("/images/{image_name}")
+async def get_image(image_name: str):
+    """
+    החזרת תמונה שחולצה ממסמך (מדיניות תמונות refs)
+    """
+    try:
+        image_path = get_image_path(image_name)
+    except FileNotFoundError:
+        raise HTTPException(status_code=404, detail=f"התמונה {image_name} לא נמצאה")
+    return FileResponse(path=image_path)
+
+def validate_image_settings(image_policy, output_format):
+    """
+    בדיקת מדיניות התמונות מהבקשה מול פורמט הפלט
+    """
+    try:
+        validate_image_policy(image_policy, output_format)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+async def convert_to_bundle(kind, file_path, output_format, base_name, **kwargs):
+    """
+    המרה עם מדיניות תמונות inline והחזרת הפלט והתמונות כקובץ ZIP
+
+    התמונות נשמרות בתיקייה זמנית של הבקשה בלבד (לא באחסון הציבורי) ונמחקות אחרי בניית ה-ZIP
+    """
+    bundle_dir = create_bundle_dir()
+    try:
+        text = await convert_document(
+            kind,
+            file_path=file_path,
+            output_format=output_format,
+            image_policy="inline",
+            image_bundle_dir=bundle_dir,
+            **kwargs
+        )
+        if not text:
+            raise HTTPException(status_code=500, detail="המרה נכשלה - התוכן ריק")
+        return Response(
+            content=build_bundle(text, output_format, base_name, bundle_dir),
+            media_type="application/zip",
+            headers={"Content-Disposition": f"attachment; filename*=UTF-8''{quote(base_name)}.zip"}
+        )
+    finally:
+        shutil.rmtree(bundle_dir, ignore_errors=True)
+
+def validate_ocr_settings(ocr_languages, dpi):
+    """
+    בדיקת הגדרות ה-OCR מהבקשה (שפות ו-DPI)
+    """
+    try:
+        parse_languages(ocr_languages)
+        parse_dpi(dpi)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
 def convert_and_save_markdown(file_path, converter_func, output_dir=None, **kwargs):
     """
     ממיר קובץ למרקדאון ושומר אותו עם אותו שם בתיקייה
@@ -66,7 +131,8 @@ def convert_and_save_markdown(file_path, converter_func, output_dir=None, **kwar
 async def standard_convert_binary(
     request: Request,
     output_format: str = Query("markdown", enum=["markdown", "json", "html"]),
-    file_name: str = Query(..., description="שם הקובץ כולל סיומת")
+    file_name: str = Query(..., description="שם הקובץ כולל סיומת"),
+    image_policy: str = Query("none", enum=IMAGE_POLICIES)
 ):
     """
     המרה סטנדרטית של מסמך בקידוד בינארי
@@ -76,6 +142,7 @@ async def standard_convert_binary(
     פרמטרים:
     - file_name: שם הקובץ כולל סיומת (חובה)
     - output_format: פורמט הפלט (markdown, json, או html)
+    - image_policy: מדיניות תמונות (none - ללא תמונות, refs - קישורים לתמונות, inline - קובץ ZIP)
     """
     # בדיקת סיומת הקובץ
     file_ext = os.path.splitext(file_name)[1][1:].lower()  # הסרת הנקודה
@@ -86,6 +153,8 @@ async def standard_convert_binary(
             detail=f"פורמט קובץ לא נתמך: {file_ext}. פורמטים נתמכים: {', '.join(SUPPORTED_FORMATS)}"
         )
     
+    validate_image_settings(image_policy, output_format)
+
     # שימוש בתיקייה קבועה במקום תיקייה זמנית
     fixed_dir = "/pd"
     temp_file_path = os.path.join(fixed_dir, file_name)
@@ -101,12 +170,23 @@ async def standard_convert_binary(
         with open(temp_file_path, "wb") as buffer:
             buffer.write(file_content)
         
+        if image_policy == "inline":
+            # החזרת הפלט והתמונות יחד בקובץ ZIP
+            return await convert_to_bundle(
+                "standard",
+                temp_file_path,
+                output_format,
+                os.path.splitext(file_name)[0]
+            )
+
         if output_format == "markdown":
             try:
                 # המרה ישירה למרקדאון
-                text = marker_standard_convert(
+                text = await convert_document(
+                    "standard",
                     file_path=temp_file_path,
-                    output_format="markdown"
+                    output_format="markdown",
+                    image_policy=image_policy
                 )
                 
                 if not text:
@@ -134,16 +214,20 @@ async def standard_convert_binary(
             except Exception as e:
                 print(f"שגיאה בעיבוד המרקדאון: {str(e)}")
                 # מעבר למצב מחזיר טקסט במקום קובץ
-                text = marker_standard_convert(
+                text = await convert_document(
+                    "standard",
                     file_path=temp_file_path,
-                    output_format="markdown"
+                    output_format="markdown",
+                    image_policy=image_policy
                 )
                 return JSONResponse(content={"text": text, "file_type": file_ext})
         else:
             # המרה רגילה לפורמט שנבחר
-            text = marker_standard_convert(
+            text = await convert_document(
+                "standard",
                 file_path=temp_file_path,
-                output_format=output_format
+                output_format=output_format,
+                image_policy=image_policy
             )
             
             # הכנת נתוני התגובה
@@ -173,7 +257,10 @@ async def standard_convert_binary(
 async def ocr_convert_binary(
     request: Request,
     output_format: str = Query("markdown", enum=["markdown", "json", "html"]),
-    file_name: str = Query(..., description="שם הקובץ כולל סיומת")
+    file_name: str = Query(..., description="שם הקובץ כולל סיומת"),
+    image_policy: str = Query("none", enum=IMAGE_POLICIES),
+    ocr_languages: Optional[str] = Query(None, description="שפות OCR מופרדות בפסיקים, למשל he,en"),
+    dpi: Optional[str] = Query(None, description="רזולוציית רינדור (72-400) או adaptive")
 ):
     """
     המרת מסמך עם OCR בקידוד בינארי
@@ -183,6 +270,9 @@ async def ocr_convert_binary(
     פרמטרים:
     - file_name: שם הקובץ כולל סיומת (חובה)
     - output_format: פורמט הפלט (markdown, json, או html)
+    - image_policy: מדיניות תמונות (none - ללא תמונות, refs - קישורים לתמונות, inline - קובץ ZIP)
+    - ocr_languages: שפות OCR מופרדות בפסיקים, למשל he,en (ברירת מחדל: זיהוי כללי)
+    - dpi: רזולוציית רינדור העמודים (72-400), או adaptive לבחירה לפי גודל העמוד והגופן
     """
     # בדיקת סיומת הקובץ
     file_ext = os.path.splitext(file_name)[1][1:].lower()  # הסרת הנקודה
@@ -193,6 +283,9 @@ async def ocr_convert_binary(
             detail=f"פורמט קובץ לא נתמך: {file_ext}. פורמטים נתמכים: {', '.join(SUPPORTED_FORMATS)}"
         )
     
+    validate_image_settings(image_policy, output_format)
+    validate_ocr_settings(ocr_languages, dpi)
+
     # שימוש בתיקייה קבועה במקום תיקייה זמנית
     fixed_dir = "/pd"
     temp_file_path = os.path.join(fixed_dir, file_name)
@@ -208,12 +301,27 @@ async def ocr_convert_binary(
         with open(temp_file_path, "wb") as buffer:
             buffer.write(file_content)
         
+        if image_policy == "inline":
+            # החזרת הפלט והתמונות יחד בקובץ ZIP
+            return await convert_to_bundle(
+                "ocr",
+                temp_file_path,
+                output_format,
+                os.path.splitext(file_name)[0],
+                ocr_languages=ocr_languages,
+                dpi=dpi
+            )
+
         if output_format == "markdown":
             try:
                 # המרה ישירה למרקדאון
-                text = marker_ocr_only_convert(
+                text = await convert_document(
+                    "ocr",
                     file_path=temp_file_path,
-                    output_format="markdown"
+                    output_format="markdown",
+                    image_policy=image_policy,
+                    ocr_languages=ocr_languages,
+                    dpi=dpi
                 )
                 
                 if not text:
@@ -241,16 +349,24 @@ async def ocr_convert_binary(
             except Exception as e:
                 print(f"שגיאה בעיבוד המרקדאון: {str(e)}")
                 # מעבר למצב מחזיר טקסט במקום קובץ
-                text = marker_ocr_only_convert(
+                text = await convert_document(
+                    "ocr",
                     file_path=temp_file_path,
-                    output_format="markdown"
+                    output_format="markdown",
+                    image_policy=image_policy,
+                    ocr_languages=ocr_languages,
+                    dpi=dpi
                 )
                 return JSONResponse(content={"text": text, "file_type": file_ext})
         else:
             # המרה רגילה לפורמט שנבחר
-            text = marker_ocr_only_convert(
+            text = await convert_document(
+                "ocr",
                 file_path=temp_file_path,
-                output_format=output_format
+                output_format=output_format,
+                image_policy=image_policy,
+                ocr_languages=ocr_languages,
+                dpi=dpi
             )
             
             # הכנת נתוני התגובה
@@ -322,7 +438,8 @@ async def gpt_convert_binary(
         if output_format == "markdown":
             try:
                 # המרה ישירה למרקדאון
-                text = marker_with_gpt_convert(
+                text = await convert_document(
+                    "gpt",
                     file_path=temp_file_path,
                     api_key=api_key,
                     model_name=model_name,
@@ -354,7 +471,8 @@ async def gpt_convert_binary(
             except Exception as e:
                 print(f"שגיאה בעיבוד המרקדאון: {str(e)}")
                 # מעבר למצב מחזיר טקסט במקום קובץ
-                text = marker_with_gpt_convert(
+                text = await convert_document(
+                    "gpt",
                     file_path=temp_file_path,
                     api_key=api_key,
                     model_name=model_name,
@@ -367,7 +485,8 @@ async def gpt_convert_binary(
                 })
         else:
             # המרה רגילה לפורמט שנבחר
-            text = marker_with_gpt_convert(
+            text = await convert_document(
+                "gpt",
                 file_path=temp_file_path,
                 api_key=api_key,
                 model_name=model_name,
@@ -401,7 +520,8 @@ async def gpt_convert_binary(
 @router.post("/standard")
 async def standard_convert_endpoint(
     file: UploadFile = File(...),
-    output_format: str = Form("markdown")
+    output_format: str = Form("markdown"),
+    image_policy: str = Form("none")
 ):
     """
     המרה סטנדרטית של מסמך ללא OCR וללא GPT
@@ -409,6 +529,7 @@ async def standard_convert_endpoint(
     פרמטרים:
     - file: קובץ המסמך לעיבוד
     - output_format: פורמט הפלט (markdown, json, או html)
+    - image_policy: מדיניות תמונות (none - ללא תמונות, refs - קישורים לתמונות, inline - קובץ ZIP)
     """
    
     filename = file.filename.lower()
@@ -423,6 +544,8 @@ async def standard_convert_endpoint(
    
     if output_format not in ["markdown", "json", "html"]:
         raise HTTPException(status_code=400, detail="פורמט הפלט חייב להיות markdown, json, או html")
+
+    validate_image_settings(image_policy, output_format)
     
 
     temp_dir = tempfile.mkdtemp()
@@ -433,10 +556,19 @@ async def standard_convert_endpoint(
         with open(temp_file_path, "wb") as buffer:
             shutil.copyfileobj(file.file, buffer)
         
+        if image_policy == "inline":
+            return await convert_to_bundle(
+                "standard",
+                temp_file_path,
+                output_format,
+                os.path.splitext(file.filename)[0]
+            )
 
-        text = marker_standard_convert(
+        text = await convert_document(
+            "standard",
             file_path=temp_file_path,
-            output_format=output_format
+            output_format=output_format,
+            image_policy=image_policy
         )
         
         if text is None:
@@ -467,7 +599,10 @@ async def standard_convert_endpoint(
 @router.post("/ocr")
 async def ocr_convert_endpoint(
     file: UploadFile = File(...),
-    output_format: str = Form("markdown")
+    output_format: str = Form("markdown"),
+    image_policy: str = Form("none"),
+    ocr_languages: Optional[str] = Form(None),
+    dpi: Optional[str] = Form(None)
 ):
     """
     המרת מסמך עם OCR בלבד
@@ -475,6 +610,9 @@ async def ocr_convert_endpoint(
     פרמטרים:
     - file: קובץ המסמך לעיבוד
     - output_format: פורמט הפלט (markdown, json, או html)
+    - image_policy: מדיניות תמונות (none - ללא תמונות, refs - קישורים לתמונות, inline - קובץ ZIP)
+    - ocr_languages: שפות OCR מופרדות בפסיקים, למשל he,en (ברירת מחדל: זיהוי כללי)
+    - dpi: רזולוציית רינדור העמודים (72-400), או adaptive לבחירה לפי גודל העמוד והגופן
     """
     # בדיקת סיומת הקובץ
     filename = file.filename.lower()
@@ -489,6 +627,10 @@ async def ocr_convert_endpoint(
     # בדיקת פורמט הפלט
     if output_format not in ["markdown", "json", "html"]:
         raise HTTPException(status_code=400, detail="פורמט הפלט חייב להיות markdown, json, או html")
+
+    validate_image_settings(image_policy, output_format)
+
+    validate_ocr_settings(ocr_languages, dpi)
     
     # יצירת קובץ זמני
     temp_dir = tempfile.mkdtemp()
@@ -499,10 +641,24 @@ async def ocr_convert_endpoint(
         with open(temp_file_path, "wb") as buffer:
             shutil.copyfileobj(file.file, buffer)
         
+        if image_policy == "inline":
+            return await convert_to_bundle(
+                "ocr",
+                temp_file_path,
+                output_format,
+                os.path.splitext(file.filename)[0],
+                ocr_languages=ocr_languages,
+                dpi=dpi
+            )
+
         # המרה עם OCR
-        text = marker_ocr_only_convert(
+        text = await convert_document(
+            "ocr",
             file_path=temp_file_path,
-            output_format=output_format
+            output_format=output_format,
+            image_policy=image_policy,
+            ocr_languages=ocr_languages,
+            dpi=dpi
         )
         
         if text is None:
@@ -570,7 +726,8 @@ async def gpt_convert_endpoint(
             shutil.copyfileobj(file.file, buffer)
         
         # המרה עם GPT
-        text = marker_with_gpt_convert(
+        text = await convert_document(
+            "gpt",
             file_path=temp_file_path,
             api_key=api_key,
             model_name=model_name,
@@ -610,7 +767,10 @@ async def parse_document_endpoint(
     use_llm: bool = Form(False),
     force_ocr: bool = Form(False),
     openai_api_key: Optional[str] = Form(None),
-    model_name: str = Form("gpt-4o")
+    model_name: str = Form("gpt-4o"),
+    image_policy: str = Form("none"),
+    ocr_languages: Optional[str] = Form(None),
+    dpi: Optional[str] = Form(None)
 ):
     """
     המרת מסמך לטקסט (נקודת קצה לתאימות לאחור)
@@ -622,6 +782,9 @@ async def parse_document_endpoint(
     - force_ocr: אילוץ עיבוד OCR על כל המסמך
     - openai_api_key: מפתח API של OpenAI (נדרש אם use_llm=True)
     - model_name: שם המודל של OpenAI (ברירת מחדל: gpt-4o)
+    - image_policy: מדיניות תמונות (none, refs, או inline) - לא רלוונטי ל-GPT
+    - ocr_languages: שפות OCR מופרדות בפסיקים (רק עם force_ocr)
+    - dpi: רזולוציית רינדור העמודים או adaptive (רק עם force_ocr)
     """
     if use_llm:
         if not openai_api_key:
@@ -635,12 +798,16 @@ async def parse_document_endpoint(
     elif force_ocr:
         return await ocr_convert_endpoint(
             file=file, 
-            output_format=output_format
+            output_format=output_format,
+            image_policy=image_policy,
+            ocr_languages=ocr_languages,
+            dpi=dpi
         )
     else:
         return await standard_convert_endpoint(
             file=file, 
-            output_format=output_format
+            output_format=output_format,
+            image_policy=image_policy
         )
 
 @router.post("/parse-pdf")
@@ -650,7 +817,10 @@ async def parse_pdf_endpoint(
     use_llm: bool = Form(False),
     force_ocr: bool = Form(False),
     openai_api_key: Optional[str] = Form(None),
-    model_name: str = Form("gpt-4o")
+    model_name: str = Form("gpt-4o"),
+    image_policy: str = Form("none"),
+    ocr_languages: Optional[str] = Form(None),
+    dpi: Optional[str] = Form(None)
 ):
     """
     המרת מסמך PDF (כינוי לתאימות לאחור)
@@ -665,5 +835,8 @@ async def parse_pdf_endpoint(
         use_llm=use_llm,
         force_ocr=force_ocr,
         openai_api_key=openai_api_key,
-        model_name=model_name
+        model_name=model_name,
+        image_policy=image_policy,
+        ocr_languages=ocr_languages,
+        dpi=dpi
     )
@@ -0,0 +1,139 @@
+import difflib
+import math
+import os
+
+import torch
+
+# פרופיל הסקה: default (דיוק מלא, ברירות המחדל של Marker) או cpu (לשרתים ללא GPU)
+INFERENCE_PROFILE = os.environ.get("INFERENCE_PROFILE", "default").lower()
+INFERENCE_PROFILES = ["default", "cpu"]
+
+# מספר תהליכי ההמרה שרצים במקביל על אותה מכונה (workers של uvicorn או של app.worker)
+WORKER_POOL_SIZE = int(os.environ.get("WORKER_POOL_SIZE", "1"))
+TORCH_INTRA_OP_THREADS = os.environ.get("TORCH_INTRA_OP_THREADS")
+TORCH_INTER_OP_THREADS = os.environ.get("TORCH_INTER_OP_THREADS")
+
+# מודלים שעוברים קוונטיזציה דינמית ל-int8 בפרופיל cpu (למשל layout_model,recognition_model).
+# ברירת המחדל ריקה - כל מודל שמוגדר כאן נבדק מול QUANTIZATION_VALIDATION_FILE בזמן הטעינה
+# ונשאר בדיוק מלא אם הדיוק שלו יורד מתחת ל-QUANTIZATION_MIN_SIMILARITY
+QUANTIZED_MODELS = [
+    name.strip()
+    for name in os.environ.get("QUANTIZED_MODELS", "").split(",")
+    if name.strip()
+]
+QUANTIZATION_VALIDATION_FILE = os.environ.get("QUANTIZATION_VALIDATION_FILE", "")
+QUANTIZATION_MIN_SIMILARITY = float(os.environ.get("QUANTIZATION_MIN_SIMILARITY", "0.98"))
+
+
+def _cgroup_cpu_limit():
+    """
+    מגבלת ה-CPU של הקונטיינר לפי cgroup (v2 או v1), או None אם אין מגבלה
+    """
+    try:
+        with open("/sys/fs/cgroup/cpu.max") as f:
+            quota, period = f.read().split()[:2]
+        if quota != "max":
+            return float(quota) / float(period)
+        return None
+    except (OSError, ValueError):
+        pass
+    try:
+        with open("/sys/fs/cgroup/cpu/cpu.cfs_quota_us") as f:
+            quota = float(f.read())
+        with open("/sys/fs/cgroup/cpu/cpu.cfs_period_us") as f:
+            period = float(f.read())
+        if quota > 0 and period > 0:
+            return quota / period
+    except (OSError, ValueError):
+        pass
+    return None
+
+
+def available_cpus() -> int:
+    """
+    מספר הליבות שהתהליך יכול להשתמש בהן בפועל - os.cpu_count מחזיר את ליבות המכונה
+    ומתעלם מ-affinity וממגבלת ה-CPU של הקונטיינר
+    """
+    if hasattr(os, "sched_getaffinity"):
+        cpus = len(os.sched_getaffinity(0))
+    else:
+        cpus = os.cpu_count() or 1
+    limit = _cgroup_cpu_limit()
+    if limit is not None:
+        cpus = min(cpus, max(1, math.ceil(limit)))
+    return max(1, cpus)
+
+
+def configure_torch_threads(pool_size: int = WORKER_POOL_SIZE) -> None:
+    """
+    חלוקת ליבות המעבד בין תהליכי ההמרה כדי שתהליכים מקבילים לא יתחרו על אותן ליבות
+
+    ברירת המחדל של torch היא להשתמש בכל הליבות בכל תהליך, כך שכמה המרות במקביל
+    מריצות יותר threads מליבות. כאן כל תהליך מקבל available_cpus / pool_size threads.
+    """
+    intra_op = int(TORCH_INTRA_OP_THREADS or max(1, available_cpus() // max(1, pool_size)))
+    inter_op = int(TORCH_INTER_OP_THREADS or 1)
+
+    torch.set_num_threads(intra_op)
+    try:
+        torch.set_num_interop_threads(inter_op)
+    except RuntimeError:
+        # ניתן לקבוע את מספר ה-inter-op threads רק לפני שהם נוצרים
+        print(f"לא ניתן לשנות את מספר ה-inter-op threads (נשאר {torch.get_num_interop_threads()})")
+
+    print(f"torch threads: intra-op={torch.get_num_threads()}, inter-op={torch.get_num_interop_threads()}")
+
+
+def apply_inference_profile() -> None:
+    """
+    הפעלת הגדרות התהליך של פרופיל ההסקה - נקרא פעם אחת בעליית התהליך
+    """
+    if INFERENCE_PROFILE not in INFERENCE_PROFILES:
+        raise ValueError(f"פרופיל הסקה לא נתמך: {INFERENCE_PROFILE}. אפשרויות: {', '.join(INFERENCE_PROFILES)}")
+    if INFERENCE_PROFILE == "cpu":
+        configure_torch_threads()
+
+
+def text_similarity(reference: str, text: str) -> float:
+    """
+    דמיון בין שני טקסטים (1.0 = זהים) - משמש למדידת סטיית הדיוק של מודלים מקוונטזים
+    """
+    return difflib.SequenceMatcher(None, reference, text, autojunk=False).ratio()
+
+
+def quantize_predictor(model_dict: dict, name: str) -> bool:
+    """
+    קוונטיזציה דינמית ל-int8 של שכבות ה-Linear במודל אחד, במקום (ללא עותק נוסף בזיכרון)
+
+    Returns:
+        bool: האם המודל עבר קוונטיזציה
+    """
+    predictor = model_dict.get(name)
+    if predictor is None:
+        print(f"המודל {name} לא קיים במילון המודלים - מדלג על קוונטיזציה")
+        return False
+    if not isinstance(getattr(predictor, "model", None), torch.nn.Module):
+        print(f"המודל {name} אינו מודל torch - מדלג על קוונטיזציה")
+        return False
+    predictor.model = torch.ao.quantization.quantize_dynamic(
+        predictor.model.float().eval(), {torch.nn.Linear}, dtype=torch.qint8, inplace=True
+    )
+    return True
+
+
+def quantized_models(model_dict: dict) -> list:
+    """
+    שמות המודלים במילון שרצים בפועל ב-int8 (יש בהם שכבות Linear מקוונטזות)
+    """
+    return [
+        name for name, predictor in model_dict.items()
+        if isinstance(getattr(predictor, "model", None), torch.nn.Module)
+        and any(isinstance(m, torch.ao.nn.quantized.dynamic.Linear) for m in predictor.model.modules())
+    ]
+
+
+def restore_predictor(model_dict: dict, name: str) -> None:
+    """
+    החזרת מודל לדיוק מלא (טעינה מחדש) אחרי שהקוונטיזציה שלו נכשלה בבדיקה
+    """
+    model_dict[name] = type(model_dict[name])(device="cpu", dtype=torch.float32)
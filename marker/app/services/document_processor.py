@@ -1,39 +1,85 @@
 import os
-from marker.converters.pdf import PdfConverter
-from marker.models import create_model_dict
-from marker.output import text_from_rendered
-from marker.config.parser import ConfigParser
-from marker.services.openai import OpenAIService
+from typing import Optional, Union
+from app.services.task_queue import get_task_queue, enqueue_and_wait
+from app.services.image_store import store_images, validate_image_policy
+from app.services.render_settings import parse_languages, resolve_dpi
 
+# Marker (ו-torch) מיובאים בתוך פונקציות ההמרה - שכבת API שרק שולחת משימות לתור
+# (TASK_QUEUE_BACKEND) לא טוענת אותם
 
-def marker_standard_convert(file_path: str, output_format: str = "markdown") -> str:
+
+def _rendered_to_text(rendered, image_policy: str, image_bundle_dir: Optional[str] = None) -> str:
+    """חילוץ הטקסט מהפלט, ושמירת התמונות לפי מדיניות התמונות"""
+    from marker.output import text_from_rendered
+
+    text, _, images = text_from_rendered(rendered)
+    if image_policy != "none" and images:
+        text = store_images(text, images, image_policy, image_bundle_dir)
+    return text
+
+
+def marker_standard_convert(
+    file_path: str,
+    output_format: str = "markdown",
+    image_policy: str = "none",
+    profile: Optional[str] = None,
+    image_bundle_dir: Optional[str] = None
+) -> str:
     """המרת קובץ עם Marker ללא GPT וללא OCR"""
-    converter = PdfConverter(
-        artifact_dict=create_model_dict(),
-        config={"output_format": output_format}
-    )
+    from app.services.model_registry import get_converter
+
+    validate_image_policy(image_policy, output_format)
+    converter = get_converter({
+        "output_format": output_format,
+        "disable_image_extraction": image_policy == "none",
+    }, profile=profile)
     rendered = converter(file_path)
-    text, _, _ = text_from_rendered(rendered)
-    return text
+    return _rendered_to_text(rendered, image_policy, image_bundle_dir)
 
 
-def marker_ocr_only_convert(file_path: str, output_format: str = "markdown") -> str:
-    """המרת קובץ עם OCR בלבד"""
-    converter = PdfConverter(
-        artifact_dict=create_model_dict(),
-        config={
-            "output_format": output_format,
-            "force_ocr": True,
-            "use_llm": False,
-        }
-    )
+def marker_ocr_only_convert(
+    file_path: str,
+    output_format: str = "markdown",
+    image_policy: str = "none",
+    ocr_languages: Optional[str] = None,
+    dpi: Optional[Union[int, str]] = None,
+    profile: Optional[str] = None,
+    image_bundle_dir: Optional[str] = None
+) -> str:
+    """המרת קובץ עם OCR בלבד, עם שפות OCR ו-DPI (מספר או adaptive) אופציונליים"""
+    from app.services.model_registry import check_config_keys, get_converter
+
+    validate_image_policy(image_policy, output_format)
+    config = {
+        "output_format": output_format,
+        "force_ocr": True,
+        "use_llm": False,
+        "disable_image_extraction": image_policy == "none",
+    }
+
+    languages = parse_languages(ocr_languages)
+    if languages:
+        check_config_keys("languages")
+        config["languages"] = ",".join(languages)
+
+    highres_dpi = resolve_dpi(file_path, dpi)
+    if highres_dpi:
+        check_config_keys("highres_image_dpi")
+        config["highres_image_dpi"] = highres_dpi
+
+    converter = get_converter(config, profile=profile)
     rendered = converter(file_path)
-    text, _, _ = text_from_rendered(rendered)
-    return text
+    return _rendered_to_text(rendered, image_policy, image_bundle_dir)
 
 
 def marker_with_gpt_convert(file_path: str, api_key: str, model_name: str = "gpt-4o", output_format: str = "markdown") -> str:
     """המרת קובץ עם GPT (תיאור לתמונות)"""
+    from marker.config.parser import ConfigParser
+    from marker.converters.pdf import PdfConverter
+    from marker.output import text_from_rendered
+
+    from app.services.model_registry import get_model_dict
+
     os.environ["OPENAI_API_KEY"] = api_key
     os.environ["OPENAI_MODEL"] = model_name
 
@@ -48,8 +94,10 @@ def marker_with_gpt_convert(file_path: str, api_key: str, model_name: str = "gpt
 
     config_parser = ConfigParser(config)
 
+    # PdfConverter כותב את llm_service (עם מפתח ה-API של הבקשה) למילון שהוא מקבל -
+    # עותק, כדי שהמפתח לא יישמר במילון המודלים המשותף
     converter = PdfConverter(
-        artifact_dict=create_model_dict(),
+        artifact_dict=dict(get_model_dict()),
         config=config_parser.generate_config_dict(),
         llm_service=config_parser.get_llm_service()
     )
@@ -57,3 +105,26 @@ def marker_with_gpt_convert(file_path: str, api_key: str, model_name: str = "gpt
     rendered = converter(file_path)
     text, _, _ = text_from_rendered(rendered)
     return text
+
+
+# פונקציות ההמרה לפי סוג - משמש גם את ה-worker לביצוע משימות מהתור
+CONVERTERS = {
+    "standard": marker_standard_convert,
+    "ocr": marker_ocr_only_convert,
+    "gpt": marker_with_gpt_convert,
+}
+
+
+async def convert_document(kind: str, file_path: str, **kwargs) -> str:
+    """
+    המרת קובץ באותו תהליך, או שליחה לתור והמתנה לתוצאה אם הוגדר TASK_QUEUE_BACKEND
+
+    Args:
+        kind: סוג ההמרה (standard, ocr, gpt)
+        file_path: נתיב לקובץ המקור
+        **kwargs: פרמטרים נוספים לפונקציית ההמרה
+    """
+    queue = get_task_queue()
+    if queue is None:
+        return CONVERTERS[kind](file_path=file_path, **kwargs)
+    return await enqueue_and_wait(queue, kind, file_path, **kwargs)
@@ -0,0 +1,147 @@
+import hashlib
+import io
+import os
+import re
+import tempfile
+import zipfile
+from typing import Optional
+
+# מדיניות חילוץ תמונות לכל בקשה:
+# none - ללא חילוץ תמונות כלל (המסלול המהיר)
+# refs - שמירת התמונות באחסון לפי תוכן והחלפת ההפניות בפלט בכתובות URL
+# inline - החזרת הפלט והתמונות יחד בקובץ ZIP
+IMAGE_POLICIES = ["none", "refs", "inline"]
+
+IMAGE_STORE_DIR = os.environ.get("IMAGE_STORE_DIR", "/pd/images")
+IMAGE_BASE_URL = os.environ.get("IMAGE_BASE_URL", "/documents/images")
+# תיקיות זמניות לתמונות של inline - נמחקות אחרי בניית ה-ZIP ואינן נגישות דרך /documents/images
+IMAGE_BUNDLE_DIR = os.environ.get("IMAGE_BUNDLE_DIR", "/pd/bundles")
+BUNDLE_IMAGE_DIR = "images"
+
+IMAGE_NAME_PATTERN = re.compile(r"^[0-9a-f]{64}\.[a-z]+$")
+BUNDLE_IMAGE_PATTERN = re.compile(BUNDLE_IMAGE_DIR + r"/([0-9a-f]{64}\.[a-z]+)")
+
+OUTPUT_EXTENSIONS = {"markdown": "md", "html": "html", "json": "json"}
+
+
+def validate_image_policy(image_policy: str, output_format: str) -> None:
+    """
+    בדיקת מדיניות התמונות מול פורמט הפלט
+
+    Raises:
+        ValueError: אם המדיניות לא נתמכת, או refs/inline עם פלט json - בפלט json
+            Marker מטמיע את התמונות כ-base64 ואין הפניות שאפשר להחליף
+    """
+    if image_policy not in IMAGE_POLICIES:
+        raise ValueError(f"מדיניות תמונות לא נתמכת: {image_policy}. אפשרויות: {', '.join(IMAGE_POLICIES)}")
+    if image_policy != "none" and output_format == "json":
+        raise ValueError("בפלט json התמונות מוטמעות כ-base64 - יש להשתמש במדיניות תמונות none")
+
+
+def create_bundle_dir() -> str:
+    """
+    יצירת תיקייה זמנית לתמונות של בקשת inline אחת (על האחסון המשותף, כדי שגם worker יוכל לכתוב אליה)
+    """
+    os.makedirs(IMAGE_BUNDLE_DIR, exist_ok=True)
+    return tempfile.mkdtemp(dir=IMAGE_BUNDLE_DIR)
+
+
+def _encode_image(image, name: str):
+    ext = os.path.splitext(name)[1][1:].lower() or "png"
+    image_format = "JPEG" if ext in ("jpg", "jpeg") else ext.upper()
+    if image_format == "JPEG" and image.mode not in ("RGB", "L"):
+        image = image.convert("RGB")
+    buffer = io.BytesIO()
+    image.save(buffer, format=image_format)
+    return buffer.getvalue(), ext
+
+
+def store_image(image, name: str, store_dir: Optional[str] = None) -> str:
+    """
+    שמירת תמונה לפי תוכן (sha256) - תמונה זהה נשמרת פעם אחת בלבד
+
+    Args:
+        image: אובייקט תמונה (PIL)
+        name: שם התמונה מ-Marker (קובע את פורמט השמירה)
+        store_dir: תיקיית היעד (ברירת מחדל: IMAGE_STORE_DIR)
+
+    Returns:
+        str: שם הקובץ באחסון (<digest>.<ext>)
+    """
+    store_dir = store_dir or IMAGE_STORE_DIR
+    data, ext = _encode_image(image, name)
+    stored_name = f"{hashlib.sha256(data).hexdigest()}.{ext}"
+    stored_path = os.path.join(store_dir, stored_name)
+
+    if not os.path.exists(stored_path):
+        os.makedirs(store_dir, exist_ok=True)
+        # כתיבה לקובץ זמני והחלפה אטומית כדי שקורא מקביל לא יראה קובץ חלקי
+        fd, tmp_path = tempfile.mkstemp(dir=store_dir)
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, stored_path)
+
+    return stored_name
+
+
+def store_images(text: str, images: dict, image_policy: str, bundle_dir: Optional[str] = None) -> str:
+    """
+    שמירת התמונות שחולצו והחלפת ההפניות אליהן בטקסט
+
+    Args:
+        text: הטקסט שהתקבל מההמרה
+        images: מילון של שם תמונה -> אובייקט תמונה (PIL)
+        image_policy: refs (אחסון ציבורי וכתובות URL) או inline (נתיב יחסי בתוך ה-ZIP)
+        bundle_dir: התיקייה הזמנית של הבקשה (חובה עבור inline)
+
+    Returns:
+        str: הטקסט עם ההפניות המעודכנות
+    """
+    if image_policy == "inline" and not bundle_dir:
+        raise ValueError("מדיניות inline דורשת תיקייה זמנית לתמונות")
+
+    for name, image in images.items():
+        if image_policy == "inline":
+            stored_name = store_image(image, name, bundle_dir)
+            target = f"{BUNDLE_IMAGE_DIR}/{stored_name}"
+        else:
+            stored_name = store_image(image, name)
+            target = f"{IMAGE_BASE_URL}/{stored_name}"
+        text = text.replace(name, target)
+    return text
+
+
+def get_image_path(image_name: str) -> str:
+    """
+    מחזיר נתיב לתמונה באחסון, או זורק FileNotFoundError אם השם לא תקין או שהתמונה לא קיימת
+    """
+    if not IMAGE_NAME_PATTERN.match(image_name):
+        raise FileNotFoundError(image_name)
+    image_path = os.path.join(IMAGE_STORE_DIR, image_name)
+    if not os.path.exists(image_path):
+        raise FileNotFoundError(image_name)
+    return image_path
+
+
+def build_bundle(text: str, output_format: str, base_name: str, bundle_dir: str) -> bytes:
+    """
+    בניית קובץ ZIP עם הפלט והתמונות שהוא מפנה אליהן
+
+    Args:
+        text: טקסט הפלט (עם הפניות ל-images/<digest>.<ext>)
+        output_format: פורמט הפלט (markdown או html)
+        base_name: שם הקובץ ללא סיומת
+        bundle_dir: התיקייה הזמנית שאליה נשמרו התמונות של הבקשה
+
+    Returns:
+        bytes: תוכן קובץ ה-ZIP
+    """
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w") as bundle:
+        bundle.writestr(f"{base_name}.{OUTPUT_EXTENSIONS[output_format]}", text, compress_type=zipfile.ZIP_DEFLATED)
+        # התמונות כבר דחוסות (JPEG/PNG) - אין טעם לדחוס אותן שוב
+        for image_name in sorted(set(BUNDLE_IMAGE_PATTERN.findall(text))):
+            image_path = os.path.join(bundle_dir, image_name)
+            if os.path.exists(image_path):
+                bundle.write(image_path, f"{BUNDLE_IMAGE_DIR}/{image_name}")
+    return buffer.getvalue()
@@ -0,0 +1,134 @@
+import json
+import os
+import threading
+from collections import OrderedDict
+from typing import Optional
+
+import torch
+from marker.config.crawler import crawler
+from marker.config.parser import ConfigParser
+from marker.converters.pdf import PdfConverter
+from marker.models import create_model_dict
+
+from marker.output import text_from_rendered
+
+from app.services.cpu_profile import (
+    INFERENCE_PROFILE,
+    QUANTIZATION_MIN_SIMILARITY,
+    QUANTIZATION_VALIDATION_FILE,
+    QUANTIZED_MODELS,
+    quantize_predictor,
+    restore_predictor,
+    text_similarity,
+)
+
+# מספר תצורות converter (שפות, DPI וכו') שנשמרות בזיכרון במקביל
+CONVERTER_CACHE_SIZE = int(os.environ.get("CONVERTER_CACHE_SIZE", "8"))
+
+_lock = threading.Lock()
+_model_dicts = {}
+_converters = OrderedDict()
+
+
+def _validation_text(model_dict: dict) -> str:
+    config_parser = ConfigParser({"output_format": "markdown", "force_ocr": True, "disable_image_extraction": True})
+    converter = PdfConverter(artifact_dict=dict(model_dict), config=config_parser.generate_config_dict())
+    text, _, _ = text_from_rendered(converter(QUANTIZATION_VALIDATION_FILE))
+    return text
+
+
+def _quantize_validated(model_dict: dict) -> dict:
+    """
+    קוונטיזציה של המודלים ב-QUANTIZED_MODELS, כל אחד בנפרד, עם בדיקת דיוק מול המודלים בדיוק מלא
+
+    מודל שהקוונטיזציה שלו נכשלת בהרצה או מורידה את הדמיון לטקסט המקורי מתחת
+    ל-QUANTIZATION_MIN_SIMILARITY נטען מחדש בדיוק מלא
+    """
+    if not QUANTIZATION_VALIDATION_FILE:
+        print("QUANTIZED_MODELS מוגדר ללא QUANTIZATION_VALIDATION_FILE - המודלים נשארים בדיוק מלא")
+        return model_dict
+
+    reference = _validation_text(model_dict)
+    for name in QUANTIZED_MODELS:
+        try:
+            if not quantize_predictor(model_dict, name):
+                continue
+            similarity = text_similarity(reference, _validation_text(model_dict))
+        except Exception as e:
+            # גם כשל באמצע quantize_dynamic (inplace) משאיר מודל חלקי - טוענים אותו מחדש
+            print(f"הקוונטיזציה של המודל {name} נכשלה: {str(e)}")
+            similarity = None
+
+        if similarity is None or similarity < QUANTIZATION_MIN_SIMILARITY:
+            print(f"המודל {name} נשאר בדיוק מלא (דמיון: {similarity})")
+            restore_predictor(model_dict, name)
+        else:
+            print(f"המודל {name} עבר קוונטיזציה ל-int8 (דמיון: {similarity:.4f})")
+    return model_dict
+
+
+def _load_model_dict(profile: str) -> dict:
+    if profile == "cpu":
+        # קוונטיזציה דינמית דורשת מודלים ב-float32 על המעבד
+        model_dict = create_model_dict(device="cpu", dtype=torch.float32)
+        if QUANTIZED_MODELS:
+            model_dict = _quantize_validated(model_dict)
+        return model_dict
+    return create_model_dict()
+
+
+def get_model_dict(profile: Optional[str] = None) -> dict:
+    """
+    מחזיר את מילון המודלים של Marker, וטוען אותו פעם אחת בלבד לכל פרופיל
+
+    Args:
+        profile: פרופיל ההסקה (default או cpu). ברירת מחדל: INFERENCE_PROFILE
+    """
+    profile = profile or INFERENCE_PROFILE
+    with _lock:
+        if profile not in _model_dicts:
+            _model_dicts[profile] = _load_model_dict(profile)
+        return _model_dicts[profile]
+
+
+def check_config_keys(*keys: str) -> None:
+    """
+    בדיקה שגרסת Marker המותקנת קוראת את מפתחות התצורה - אחרת ההגדרה הייתה מתעלמת בשקט
+
+    Raises:
+        ValueError: אם אחד המפתחות לא מוכר ל-Marker
+    """
+    unknown = [key for key in keys if key not in crawler.attr_set]
+    if unknown:
+        raise ValueError(f"גרסת Marker המותקנת לא תומכת בהגדרות: {', '.join(unknown)}")
+
+
+def get_converter(options: dict, profile: Optional[str] = None) -> PdfConverter:
+    """
+    מחזיר converter לתצורה הנתונה - משתמש במודלים הטעונים ושומר את התצורות האחרונות במטמון
+
+    Args:
+        options: אפשרויות Marker בפורמט של שורת הפקודה (output_format, languages="he,en",
+            disable_image_extraction וכו'). ללא llm_service - converters עם GPT לא נשמרים במטמון
+        profile: פרופיל ההסקה (default או cpu). ברירת מחדל: INFERENCE_PROFILE
+    """
+    profile = profile or INFERENCE_PROFILE
+    key = json.dumps([profile, options], sort_keys=True)
+    artifact_dict = get_model_dict(profile)
+    with _lock:
+        if key in _converters:
+            _converters.move_to_end(key)
+            return _converters[key]
+        # ConfigParser ממיר את האפשרויות לתצורה ש-Marker קורא (למשל disable_image_extraction
+        # ל-extract_images) ובוחר renderer לפי output_format
+        config_parser = ConfigParser(options)
+        # עותק של מילון המודלים - PdfConverter כותב אליו את llm_service
+        converter = PdfConverter(
+            artifact_dict=dict(artifact_dict),
+            config=config_parser.generate_config_dict(),
+            renderer=config_parser.get_renderer()
+        )
+        _converters[key] = converter
+        if len(_converters) > CONVERTER_CACHE_SIZE:
+            _converters.popitem(last=False)
+        return converter
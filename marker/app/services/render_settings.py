@@ -0,0 +1,184 @@
+import importlib.util
+import os
+import re
+import statistics
+from typing import List, Optional, Union
+
+# רזולוציית ברירת המחדל של Marker לתמונות העמודים שעוברות OCR
+DEFAULT_DPI = 192
+MIN_DPI = 72
+MAX_DPI = 400
+SMALL_FONT_DPI = 288
+# adaptive בוחר רק מתוך הרמות האלה, כדי שמספר תצורות ה-converter במטמון יישאר קטן
+ADAPTIVE_DPI_LEVELS = (96, 144, DEFAULT_DPI, SMALL_FONT_DPI)
+
+# עמוד גדול מ-A4 (842 נקודות בצד הארוך) מרונדר ברזולוציה נמוכה יותר
+A4_LONG_SIDE_PT = 842
+# גופן קטן מזה (בנקודות) מקבל רזולוציה גבוהה יותר
+SMALL_FONT_PT = 8
+ADAPTIVE_SAMPLE_PAGES = 5
+
+# עמוד "נקי": שכבת טקסט אמיתית (מספיק תווים, מעט תווים לא קריאים) ולא סריקה (תמונות מכסות מעט מהעמוד)
+CLEAN_MIN_CHARS = 200
+CLEAN_MAX_BAD_CHAR_RATIO = 0.05
+CLEAN_MAX_IMAGE_COVERAGE = 0.5
+
+LANGUAGE_PATTERN = re.compile(r"^[a-z]{2,3}(_[a-z]+)?$")
+
+
+_supported_languages = None
+
+
+def supported_ocr_languages() -> Optional[set]:
+    """
+    קודי השפות שמודל ה-OCR של Marker (surya) מכיר, או None אם surya לא מותקן
+
+    נטען רק הקובץ surya/recognition/languages.py - ייבוא surya.recognition טוען את torch,
+    ושכבת ה-API לא צריכה אותו רק כדי לבדוק את הבקשה
+    """
+    global _supported_languages
+    if _supported_languages is None:
+        surya_spec = importlib.util.find_spec("surya")
+        if surya_spec is None:
+            return None
+        spec = importlib.util.spec_from_file_location(
+            "_surya_languages",
+            os.path.join(os.path.dirname(surya_spec.origin), "recognition", "languages.py")
+        )
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+        _supported_languages = set(module.CODE_TO_LANGUAGE)
+    return _supported_languages
+
+
+def parse_languages(ocr_languages: Optional[str]) -> Optional[List[str]]:
+    """
+    המרת רשימת שפות מופרדת בפסיקים (למשל "he,en") לרשימה
+
+    Raises:
+        ValueError: אם אחד מקודי השפה לא תקין או לא נתמך ע"י מודל ה-OCR - קוד לא מוכר
+            (למשל heb של Tesseract) נכשל רק באמצע ההמרה
+    """
+    if not ocr_languages:
+        return None
+    languages = [lang.strip().lower() for lang in ocr_languages.split(",") if lang.strip()]
+    supported = supported_ocr_languages()
+    for lang in languages:
+        if not LANGUAGE_PATTERN.match(lang):
+            raise ValueError(f"קוד שפה לא תקין: {lang}")
+        if supported is not None and lang not in supported:
+            raise ValueError(f"שפה לא נתמכת ב-OCR: {lang}")
+    return languages or None
+
+
+def parse_dpi(dpi: Optional[str]) -> Optional[Union[int, str]]:
+    """
+    בדיקת ערך ה-DPI מהבקשה: מספר בין MIN_DPI ל-MAX_DPI, "adaptive", או None לברירת מחדל
+
+    Raises:
+        ValueError: אם הערך לא תקין
+    """
+    if dpi is None or dpi == "":
+        return None
+    if str(dpi).lower() == "adaptive":
+        return "adaptive"
+    try:
+        value = int(dpi)
+    except ValueError:
+        raise ValueError(f"ערך DPI לא תקין: {dpi}")
+    if not MIN_DPI <= value <= MAX_DPI:
+        raise ValueError(f"ערך DPI חייב להיות בין {MIN_DPI} ל-{MAX_DPI}")
+    return value
+
+
+def is_clean_page(char_count: int, bad_char_count: int, image_coverage: float) -> bool:
+    """
+    עמוד עם שכבת טקסט אמינה שאינו סריקה - OCR ברזולוציה נמוכה מספיק בשבילו
+
+    Args:
+        char_count: מספר התווים בשכבת הטקסט
+        bad_char_count: תווים לא קריאים (תו חלופי או תווי בקרה) - סימן לשכבת טקסט פגומה
+        image_coverage: החלק מתוך שטח העמוד שמכוסה בתמונות (0-1)
+    """
+    return (
+        char_count >= CLEAN_MIN_CHARS
+        and bad_char_count <= char_count * CLEAN_MAX_BAD_CHAR_RATIO
+        and image_coverage <= CLEAN_MAX_IMAGE_COVERAGE
+    )
+
+
+def pick_adaptive_dpi(long_side: float, median_font_size: Optional[float], clean: bool) -> int:
+    """
+    בחירת רמת DPI מתוך ADAPTIVE_DPI_LEVELS:
+    - גופן קטן בשכבת הטקסט - רזולוציה גבוהה יותר כדי שה-OCR יזהה את האותיות
+    - עמודים גדולים ונקיים - רזולוציה נמוכה יותר (מספר הפיקסלים לא עולה על עמוד A4)
+    - אחרת (למשל סריקות) - רזולוציית ברירת המחדל
+    """
+    if median_font_size is not None and median_font_size < SMALL_FONT_PT:
+        return SMALL_FONT_DPI
+
+    if clean and long_side > A4_LONG_SIDE_PT:
+        target = DEFAULT_DPI * A4_LONG_SIDE_PT / long_side
+        return max([level for level in ADAPTIVE_DPI_LEVELS if level <= target], default=ADAPTIVE_DPI_LEVELS[0])
+
+    return DEFAULT_DPI
+
+
+def _image_coverage(page, pdfium) -> float:
+    width, height = page.get_size()
+    covered = 0.0
+    for obj in page.get_objects(filter=[pdfium.raw.FPDF_PAGEOBJ_IMAGE]):
+        left, bottom, right, top = obj.get_pos()
+        covered += max(0.0, right - left) * max(0.0, top - bottom)
+    return min(1.0, covered / (width * height)) if width and height else 0.0
+
+
+def choose_adaptive_dpi(file_path: str) -> int:
+    """
+    בחירת רזולוציה לפי מדגם עמודים מה-PDF (ראו pick_adaptive_dpi)
+
+    הרזולוציה יורדת רק אם כל העמודים במדגם נקיים
+    """
+    if os.path.splitext(file_path)[1].lower() != ".pdf":
+        return DEFAULT_DPI
+
+    import pypdfium2 as pdfium
+
+    pdf = pdfium.PdfDocument(file_path)
+    try:
+        long_sides = []
+        font_sizes = []
+        clean = True
+        for page_index in range(min(len(pdf), ADAPTIVE_SAMPLE_PAGES)):
+            page = pdf[page_index]
+            width, height = page.get_size()
+            long_sides.append(max(width, height))
+            textpage = page.get_textpage()
+            char_count = textpage.count_chars()
+            for char_index in range(char_count):
+                size = pdfium.raw.FPDFText_GetFontSize(textpage.raw, char_index)
+                if size > 0:
+                    font_sizes.append(size)
+            text = textpage.get_text_bounded()
+            bad_chars = sum(1 for c in text if c == "\ufffd" or (ord(c) < 32 and c not in "\r\n\t"))
+            clean = clean and is_clean_page(char_count, bad_chars, _image_coverage(page, pdfium))
+            textpage.close()
+            page.close()
+    finally:
+        pdf.close()
+
+    if not long_sides:
+        return DEFAULT_DPI
+
+    median_font_size = statistics.median(font_sizes) if font_sizes else None
+    return pick_adaptive_dpi(max(long_sides), median_font_size, clean)
+
+
+def resolve_dpi(file_path: str, dpi: Optional[Union[int, str]]) -> Optional[int]:
+    """
+    מחזיר את ה-DPI שיש להעביר ל-Marker, או None לשימוש בברירת המחדל
+    """
+    dpi = parse_dpi(dpi)
+    if dpi == "adaptive":
+        return choose_adaptive_dpi(file_path)
+    return dpi
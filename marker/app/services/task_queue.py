@@ -0,0 +1,514 @@
+import asyncio
+import json
+import os
+import shutil
+import sqlite3
+import time
+import uuid
+from abc import ABC, abstractmethod
+from contextlib import closing
+from typing import Optional
+
+# הגדרות התור נקראות ממשתני סביבה כדי שאותו קוד ירוץ גם בשכבת ה-API וגם ב-workers
+TASK_QUEUE_BACKEND = os.environ.get("TASK_QUEUE_BACKEND", "inline").lower()
+TASK_STORAGE_DIR = os.environ.get("TASK_STORAGE_DIR", "/pd/tasks")
+TASK_QUEUE_URL = os.environ.get("TASK_QUEUE_URL", "")
+HEARTBEAT_INTERVAL = float(os.environ.get("TASK_HEARTBEAT_INTERVAL", "10"))
+HEARTBEAT_TIMEOUT = float(os.environ.get("TASK_HEARTBEAT_TIMEOUT", "60"))
+MAX_ATTEMPTS = int(os.environ.get("TASK_MAX_ATTEMPTS", "3"))
+TASK_WAIT_TIMEOUT = float(os.environ.get("TASK_WAIT_TIMEOUT", "900"))
+TASK_POLL_INTERVAL = float(os.environ.get("TASK_POLL_INTERVAL", "0.5"))
+# זמן שמירת רשומות של משימות שהסתיימו, למקרה שאף אחד לא קרא ומחק אותן
+TASK_RECORD_TTL = float(os.environ.get("TASK_RECORD_TTL", "86400"))
+
+STATUS_PENDING = "pending"
+STATUS_RUNNING = "running"
+STATUS_DONE = "done"
+STATUS_FAILED = "failed"
+
+
+class TaskQueue(ABC):
+    """
+    ממשק בסיסי לתור משימות המרה
+
+    כל משימה היא מילון עם השדות: id, kind, params, status, attempts,
+    worker_id, heartbeat_at, result_path, error
+
+    heartbeat, complete ו-fail מעדכנים את המשימה רק אם היא עדיין רצה אצל אותו worker,
+    כך ש-worker שנתקע (והמשימה שלו הוחזרה לתור) לא דורס את מצב המשימה.
+    """
+
+    @abstractmethod
+    def enqueue(self, kind: str, params: dict) -> str:
+        pass
+
+    @abstractmethod
+    def claim(self, worker_id: str) -> Optional[dict]:
+        pass
+
+    @abstractmethod
+    def heartbeat(self, task_id: str, worker_id: str) -> bool:
+        pass
+
+    @abstractmethod
+    def complete(self, task_id: str, worker_id: str, result_path: str) -> bool:
+        pass
+
+    @abstractmethod
+    def fail(self, task_id: str, worker_id: str, error: str) -> bool:
+        pass
+
+    @abstractmethod
+    def cancel(self, task_id: str, reason: str) -> bool:
+        """
+        סימון משימה שלא הסתיימה (ממתינה או רצה) כנכשלת - למשל כשהבקשה בוטלה או חרגה מזמן ההמתנה
+        """
+
+    @abstractmethod
+    def get(self, task_id: str) -> Optional[dict]:
+        pass
+
+    @abstractmethod
+    def delete(self, task_id: str) -> None:
+        """
+        מחיקת רשומת המשימה - נקרא אחרי שהתוצאה נקראה
+        """
+
+    @abstractmethod
+    def requeue_stale(self) -> int:
+        """
+        החזרת משימות של workers שקרסו (ללא heartbeat) לתור
+
+        Returns:
+            int: מספר המשימות שהוחזרו לתור או סומנו כנכשלות
+        """
+
+
+class SQLiteTaskQueue(TaskQueue):
+    """
+    תור משימות מבוסס SQLite - מתאים לשרת יחיד (או מספר תהליכים על אותה מכונה)
+    """
+
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        os.makedirs(os.path.dirname(db_path) or ".", exist_ok=True)
+        with closing(self._connect()) as conn:
+            conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS tasks (
+                    id TEXT PRIMARY KEY,
+                    kind TEXT NOT NULL,
+                    params TEXT NOT NULL,
+                    status TEXT NOT NULL,
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    worker_id TEXT,
+                    heartbeat_at REAL,
+                    result_path TEXT,
+                    error TEXT,
+                    created_at REAL NOT NULL
+                )
+                """
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_tasks_status ON tasks (status, created_at)")
+
+    def _connect(self):
+        # isolation_level=None - ניהול טרנזקציות ידני (BEGIN IMMEDIATE) לנעילת כתיבה בזמן claim
+        conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        # WAL - קריאות (get של שכבת ה-API) לא נחסמות בזמן ש-worker מחזיק טרנזקציית כתיבה
+        conn.execute("PRAGMA journal_mode=WAL")
+        return conn
+
+    @staticmethod
+    def _row_to_task(row) -> Optional[dict]:
+        if row is None:
+            return None
+        task = dict(row)
+        task["params"] = json.loads(task["params"])
+        return task
+
+    def _update_owned(self, task_id: str, worker_id: str, assignments: str, values: tuple) -> bool:
+        with closing(self._connect()) as conn:
+            return conn.execute(
+                f"UPDATE tasks SET {assignments} WHERE id = ? AND worker_id = ? AND status = ?",
+                values + (task_id, worker_id, STATUS_RUNNING)
+            ).rowcount > 0
+
+    def enqueue(self, kind: str, params: dict) -> str:
+        task_id = params.get("task_id") or uuid.uuid4().hex
+        with closing(self._connect()) as conn:
+            conn.execute(
+                "INSERT INTO tasks (id, kind, params, status, created_at) VALUES (?, ?, ?, ?, ?)",
+                (task_id, kind, json.dumps(params), STATUS_PENDING, time.time())
+            )
+        return task_id
+
+    def claim(self, worker_id: str) -> Optional[dict]:
+        conn = self._connect()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            row = conn.execute(
+                "SELECT * FROM tasks WHERE status = ? ORDER BY created_at LIMIT 1",
+                (STATUS_PENDING,)
+            ).fetchone()
+            if row is None:
+                conn.execute("COMMIT")
+                return None
+            conn.execute(
+                "UPDATE tasks SET status = ?, worker_id = ?, heartbeat_at = ?, attempts = attempts + 1 WHERE id = ?",
+                (STATUS_RUNNING, worker_id, time.time(), row["id"])
+            )
+            conn.execute("COMMIT")
+            task = self._row_to_task(row)
+            task.update(status=STATUS_RUNNING, worker_id=worker_id, attempts=task["attempts"] + 1)
+            return task
+        except Exception:
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            raise
+        finally:
+            conn.close()
+
+    def heartbeat(self, task_id: str, worker_id: str) -> bool:
+        return self._update_owned(task_id, worker_id, "heartbeat_at = ?", (time.time(),))
+
+    def complete(self, task_id: str, worker_id: str, result_path: str) -> bool:
+        # ניקוי הפרמטרים (עשויים לכלול מפתח API) כשהמשימה מסתיימת
+        return self._update_owned(
+            task_id, worker_id, "status = ?, result_path = ?, params = '{}'", (STATUS_DONE, result_path)
+        )
+
+    def fail(self, task_id: str, worker_id: str, error: str) -> bool:
+        return self._update_owned(
+            task_id, worker_id, "status = ?, error = ?, params = '{}'", (STATUS_FAILED, error)
+        )
+
+    def cancel(self, task_id: str, reason: str) -> bool:
+        with closing(self._connect()) as conn:
+            return conn.execute(
+                "UPDATE tasks SET status = ?, error = ?, params = '{}' WHERE id = ? AND status IN (?, ?)",
+                (STATUS_FAILED, reason, task_id, STATUS_PENDING, STATUS_RUNNING)
+            ).rowcount > 0
+
+    def get(self, task_id: str) -> Optional[dict]:
+        with closing(self._connect()) as conn:
+            row = conn.execute("SELECT * FROM tasks WHERE id = ?", (task_id,)).fetchone()
+        return self._row_to_task(row)
+
+    def delete(self, task_id: str) -> None:
+        with closing(self._connect()) as conn:
+            conn.execute("DELETE FROM tasks WHERE id = ?", (task_id,))
+
+    def requeue_stale(self) -> int:
+        now = time.time()
+        deadline = now - HEARTBEAT_TIMEOUT
+        conn = self._connect()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            failed = conn.execute(
+                "UPDATE tasks SET status = ?, error = ?, params = '{}', worker_id = NULL "
+                "WHERE status = ? AND heartbeat_at < ? AND attempts >= ?",
+                (STATUS_FAILED, "worker נפל יותר מדי פעמים", STATUS_RUNNING, deadline, MAX_ATTEMPTS)
+            ).rowcount
+            requeued = conn.execute(
+                "UPDATE tasks SET status = ?, worker_id = NULL WHERE status = ? AND heartbeat_at < ?",
+                (STATUS_PENDING, STATUS_RUNNING, deadline)
+            ).rowcount
+            # רשומות של משימות שהסתיימו ואף אחד לא קרא את התוצאה שלהן (למשל שרת ה-API נפל)
+            conn.execute(
+                "DELETE FROM tasks WHERE status IN (?, ?) AND created_at < ?",
+                (STATUS_DONE, STATUS_FAILED, now - TASK_RECORD_TTL)
+            )
+            conn.execute("COMMIT")
+            return failed + requeued
+        except Exception:
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            raise
+        finally:
+            conn.close()
+
+
+class RedisTaskQueue(TaskQueue):
+    """
+    תור משימות מבוסס Redis - מתאים למספר שרתים (API ו-workers על מכונות נפרדות)
+
+    משתמש רק בפקודות בסיסיות (LPUSH, RPOPLPUSH, LREM, LRANGE, HSET, HGETALL, HDEL, DEL,
+    WATCH/MULTI, EXPIRE) כך שכל שרת תואם Redis יכול לשמש כ-backend.
+    כל שינוי מצב של משימה נעשה בטרנזקציה עם WATCH על ה-hash שלה.
+    """
+
+    PENDING_KEY = "marker:tasks:pending"
+    RUNNING_KEY = "marker:tasks:running"
+    TASK_KEY = "marker:task:{}"
+
+    def __init__(self, url: Optional[str] = None, client=None):
+        if client is None:
+            import redis
+
+            client = redis.Redis.from_url(url, decode_responses=True)
+        self.client = client
+
+    def _task_key(self, task_id: str) -> str:
+        return self.TASK_KEY.format(task_id)
+
+    def _transaction(self, task_id: str, func):
+        """
+        הרצת func(pipe, task) בטרנזקציה עם WATCH על המשימה - נשלחת מחדש אם המשימה השתנתה בינתיים
+
+        func קורא את המשימה, ואם צריך לשנות אותה קורא ל-pipe.multi() ומוסיף פקודות
+        """
+        key = self._task_key(task_id)
+
+        def run(pipe):
+            task = pipe.hgetall(key)
+            return func(pipe, task)
+
+        return self.client.transaction(run, key, value_from_callable=True)
+
+    def _finish_owned(self, task_id: str, worker_id: str, fields: dict) -> bool:
+        def finish(pipe, task):
+            if task.get("status") != STATUS_RUNNING or task.get("worker_id") != worker_id:
+                return False
+            pipe.multi()
+            pipe.hset(self._task_key(task_id), mapping=dict(fields, params="{}"))
+            pipe.expire(self._task_key(task_id), int(TASK_RECORD_TTL))
+            pipe.lrem(self.RUNNING_KEY, 0, task_id)
+            return True
+
+        return self._transaction(task_id, finish)
+
+    def enqueue(self, kind: str, params: dict) -> str:
+        task_id = params.get("task_id") or uuid.uuid4().hex
+        self.client.hset(self._task_key(task_id), mapping={
+            "id": task_id,
+            "kind": kind,
+            "params": json.dumps(params),
+            "status": STATUS_PENDING,
+            "attempts": 0,
+            "created_at": time.time(),
+        })
+        self.client.lpush(self.PENDING_KEY, task_id)
+        return task_id
+
+    def claim(self, worker_id: str) -> Optional[dict]:
+        while True:
+            # העברה אטומית מרשימת הממתינים לרשימת הרצים - משימה לא הולכת לאיבוד אם ה-worker קורס.
+            # אם ה-worker קורס לפני שהמשימה מסומנת כרצה, requeue_stale מחזיר אותה לתור (ראו שם)
+            task_id = self.client.rpoplpush(self.PENDING_KEY, self.RUNNING_KEY)
+            if task_id is None:
+                return None
+
+            def mark_running(pipe, task):
+                if task.get("status") != STATUS_PENDING:
+                    return "gone"
+                # ה-worker נתקע באמצע claim ו-requeue_stale כבר החזיר את המשימה לתור
+                if task_id not in pipe.lrange(self.RUNNING_KEY, 0, -1):
+                    return "requeued"
+                pipe.multi()
+                pipe.hset(self._task_key(task_id), mapping={
+                    "status": STATUS_RUNNING,
+                    "worker_id": worker_id,
+                    "heartbeat_at": time.time(),
+                    "attempts": int(task.get("attempts", 0)) + 1,
+                })
+                pipe.hdel(self._task_key(task_id), "claimed_at")
+                return "claimed"
+
+            result = self._transaction(task_id, mark_running)
+            if result == "claimed":
+                return self.get(task_id)
+            if result == "gone":
+                # המשימה בוטלה או נמחקה בזמן שהמתינה בתור
+                self.client.lrem(self.RUNNING_KEY, 0, task_id)
+
+    def heartbeat(self, task_id: str, worker_id: str) -> bool:
+        def beat(pipe, task):
+            if task.get("status") != STATUS_RUNNING or task.get("worker_id") != worker_id:
+                return False
+            pipe.multi()
+            pipe.hset(self._task_key(task_id), "heartbeat_at", time.time())
+            return True
+
+        return self._transaction(task_id, beat)
+
+    def complete(self, task_id: str, worker_id: str, result_path: str) -> bool:
+        return self._finish_owned(task_id, worker_id, {"status": STATUS_DONE, "result_path": result_path})
+
+    def fail(self, task_id: str, worker_id: str, error: str) -> bool:
+        return self._finish_owned(task_id, worker_id, {"status": STATUS_FAILED, "error": error})
+
+    def cancel(self, task_id: str, reason: str) -> bool:
+        def cancel_task(pipe, task):
+            if task.get("status") not in (STATUS_PENDING, STATUS_RUNNING):
+                return False
+            pipe.multi()
+            pipe.hset(self._task_key(task_id), mapping={"status": STATUS_FAILED, "error": reason, "params": "{}"})
+            pipe.hdel(self._task_key(task_id), "worker_id")
+            pipe.expire(self._task_key(task_id), int(TASK_RECORD_TTL))
+            pipe.lrem(self.PENDING_KEY, 0, task_id)
+            pipe.lrem(self.RUNNING_KEY, 0, task_id)
+            return True
+
+        return self._transaction(task_id, cancel_task)
+
+    def get(self, task_id: str) -> Optional[dict]:
+        data = self.client.hgetall(self._task_key(task_id))
+        if not data:
+            return None
+        data["params"] = json.loads(data.get("params", "{}"))
+        data["attempts"] = int(data.get("attempts", 0))
+        if "heartbeat_at" in data:
+            data["heartbeat_at"] = float(data["heartbeat_at"])
+        return data
+
+    def delete(self, task_id: str) -> None:
+        self.client.delete(self._task_key(task_id))
+
+    def requeue_stale(self) -> int:
+        now = time.time()
+        deadline = now - HEARTBEAT_TIMEOUT
+
+        def requeue_claimed(pipe, task, task_id):
+            # משימה ברשימת הרצים שעדיין ממתינה נמצאת באמצע claim, או שה-worker קרס בין RPOPLPUSH
+            # לסימון המשימה כרצה. בפעם הראשונה שהיא נראית כך נרשם זמן ה-claim, והיא מוחזרת
+            # לתור אם היא עדיין תקועה אחרי HEARTBEAT_TIMEOUT
+            key = self._task_key(task_id)
+            if "claimed_at" not in task:
+                pipe.multi()
+                pipe.hset(key, "claimed_at", now)
+                return False
+            if float(task["claimed_at"]) >= deadline:
+                return False
+            pipe.multi()
+            pipe.lrem(self.RUNNING_KEY, 0, task_id)
+            pipe.hdel(key, "claimed_at")
+            pipe.hset(key, "status", STATUS_PENDING)
+            pipe.lpush(self.PENDING_KEY, task_id)
+            return True
+
+        def requeue(pipe, task, task_id):
+            key = self._task_key(task_id)
+            if not task:
+                pipe.multi()
+                pipe.lrem(self.RUNNING_KEY, 0, task_id)
+                return False
+            if task.get("status") == STATUS_PENDING:
+                return requeue_claimed(pipe, task, task_id)
+            if task.get("status") != STATUS_RUNNING or "heartbeat_at" not in task:
+                return False
+            if float(task["heartbeat_at"]) >= deadline:
+                return False
+            pipe.multi()
+            pipe.lrem(self.RUNNING_KEY, 0, task_id)
+            pipe.hdel(key, "worker_id", "heartbeat_at")
+            if int(task.get("attempts", 0)) >= MAX_ATTEMPTS:
+                pipe.hset(key, mapping={
+                    "status": STATUS_FAILED,
+                    "error": "worker נפל יותר מדי פעמים",
+                    "params": "{}",
+                })
+                pipe.expire(key, int(TASK_RECORD_TTL))
+            else:
+                pipe.hset(key, "status", STATUS_PENDING)
+                pipe.lpush(self.PENDING_KEY, task_id)
+            return True
+
+        count = 0
+        for task_id in self.client.lrange(self.RUNNING_KEY, 0, -1):
+            if self._transaction(task_id, lambda pipe, task: requeue(pipe, task, task_id)):
+                count += 1
+        return count
+
+
+_task_queue = None
+
+
+def get_task_queue() -> Optional[TaskQueue]:
+    """
+    מחזיר את תור המשימות המוגדר, או None במצב inline (המרה באותו תהליך)
+    """
+    global _task_queue
+    if TASK_QUEUE_BACKEND in ("", "inline"):
+        return None
+    if _task_queue is None:
+        if TASK_QUEUE_BACKEND == "sqlite":
+            _task_queue = SQLiteTaskQueue(TASK_QUEUE_URL or os.path.join(TASK_STORAGE_DIR, "tasks.db"))
+        elif TASK_QUEUE_BACKEND == "redis":
+            _task_queue = RedisTaskQueue(TASK_QUEUE_URL or "redis://localhost:6379/0")
+        else:
+            raise ValueError(f"backend תור לא נתמך: {TASK_QUEUE_BACKEND}")
+    return _task_queue
+
+
+def stage_input(file_path: str, task_id: str) -> str:
+    """
+    העתקת קובץ הקלט לאחסון המשותף כדי שה-worker (אולי על מכונה אחרת) יוכל לקרוא אותו
+    """
+    input_dir = os.path.join(TASK_STORAGE_DIR, "inputs", task_id)
+    os.makedirs(input_dir, exist_ok=True)
+    staged_path = os.path.join(input_dir, os.path.basename(file_path))
+    shutil.copyfile(file_path, staged_path)
+    return staged_path
+
+
+def result_path_for(task_id: str, worker_id: str) -> str:
+    # קובץ נפרד לכל worker - worker שנתקע לא דורס את התוצאה של ה-worker שקיבל את המשימה אחריו
+    results_dir = os.path.join(TASK_STORAGE_DIR, "results")
+    os.makedirs(results_dir, exist_ok=True)
+    return os.path.join(results_dir, f"{task_id}-{worker_id}.out")
+
+
+def cleanup_task_files(task_id: str, result_path: Optional[str] = None) -> None:
+    shutil.rmtree(os.path.join(TASK_STORAGE_DIR, "inputs", task_id), ignore_errors=True)
+    if result_path and os.path.exists(result_path):
+        os.remove(result_path)
+
+
+def _read_result(task: dict) -> str:
+    with open(task["result_path"], "r", encoding="utf-8") as f:
+        return f.read()
+
+
+def _discard_task(queue: TaskQueue, task_id: str) -> None:
+    # בזמן חריגה מזמן ההמתנה או ביטול הבקשה המשימה עדיין בתור - מסמנים אותה כנכשלת
+    # לפני מחיקת הקלט, כדי ש-worker לא ינסה להריץ אותה
+    queue.cancel(task_id, "הבקשה בוטלה או חרגה מזמן ההמתנה")
+    task = queue.get(task_id)
+    cleanup_task_files(task_id, task.get("result_path") if task else None)
+    queue.delete(task_id)
+
+
+async def enqueue_and_wait(queue: TaskQueue, kind: str, file_path: str, **params) -> str:
+    """
+    שליחת משימת המרה לתור והמתנה לתוצאה מה-worker
+
+    פעולות התור והקבצים חוסמות (SQLite ממתין לנעילה עד 30 שניות) - הן רצות ב-thread
+    נפרד כדי לא לעצור את שאר הבקשות
+
+    Args:
+        queue: תור המשימות
+        kind: סוג ההמרה (standard, ocr, gpt)
+        file_path: נתיב לקובץ המקור
+        **params: פרמטרים נוספים לפונקציית ההמרה
+
+    Returns:
+        str: הטקסט שהתקבל מההמרה
+    """
+    task_id = uuid.uuid4().hex
+    staged_path = await asyncio.to_thread(stage_input, file_path, task_id)
+    try:
+        await asyncio.to_thread(queue.enqueue, kind, dict(params, task_id=task_id, file_path=staged_path))
+
+        deadline = time.monotonic() + TASK_WAIT_TIMEOUT
+        while True:
+            task = await asyncio.to_thread(queue.get, task_id)
+            if task and task["status"] == STATUS_DONE:
+                return await asyncio.to_thread(_read_result, task)
+            if task and task["status"] == STATUS_FAILED:
+                raise RuntimeError(f"משימת ההמרה {task_id} נכשלה: {task.get('error')}")
+            if time.monotonic() > deadline:
+                raise TimeoutError(f"משימת ההמרה {task_id} לא הסתיימה תוך {TASK_WAIT_TIMEOUT} שניות")
+            await asyncio.sleep(TASK_POLL_INTERVAL)
+    finally:
+        await asyncio.to_thread(_discard_task, queue, task_id)
@@ -0,0 +1,99 @@
+"""
+Worker להמרת מסמכים - מושך משימות מתור המשימות ושומר את התוצאות באחסון המשותף
+
+הפעלה:
+    TASK_QUEUE_BACKEND=redis TASK_QUEUE_URL=redis://queue:6379/0 python -m app.worker
+"""
+import os
+import socket
+import threading
+import time
+import traceback
+import uuid
+
+from app.services.cpu_profile import apply_inference_profile
+from app.services.document_processor import CONVERTERS
+from app.services.task_queue import (
+    HEARTBEAT_INTERVAL,
+    get_task_queue,
+    result_path_for,
+)
+
+IDLE_SLEEP = float(os.environ.get("WORKER_IDLE_SLEEP", "1"))
+
+
+def _heartbeat_loop(queue, task_id: str, worker_id: str, stop_event: threading.Event):
+    while not stop_event.wait(HEARTBEAT_INTERVAL):
+        try:
+            if not queue.heartbeat(task_id, worker_id):
+                print(f"המשימה {task_id} כבר לא שייכת ל-worker הזה")
+        except Exception as e:
+            print(f"שגיאה בשליחת heartbeat למשימה {task_id}: {str(e)}")
+
+
+def process_task(queue, task: dict, worker_id: str) -> None:
+    """
+    ביצוע משימת המרה אחת תוך שליחת heartbeat ברקע
+    """
+    task_id = task["id"]
+    params = dict(task["params"])
+    params.pop("task_id", None)
+    file_path = params.pop("file_path")
+
+    stop_event = threading.Event()
+    heartbeat_thread = threading.Thread(
+        target=_heartbeat_loop,
+        args=(queue, task_id, worker_id, stop_event),
+        daemon=True
+    )
+    heartbeat_thread.start()
+    try:
+        text = CONVERTERS[task["kind"]](file_path=file_path, **params)
+        if text is None:
+            raise ValueError("כשל בעיבוד המסמך")
+
+        result_path = result_path_for(task_id, worker_id)
+        with open(result_path, "w", encoding="utf-8") as f:
+            f.write(text)
+        if not queue.complete(task_id, worker_id, result_path):
+            # המשימה הוחזרה לתור, הועברה ל-worker אחר או בוטלה בזמן ההמרה
+            print(f"המשימה {task_id} כבר לא שייכת ל-worker הזה - התוצאה נמחקת")
+            os.remove(result_path)
+    except Exception as e:
+        traceback.print_exc()
+        queue.fail(task_id, worker_id, str(e))
+    finally:
+        stop_event.set()
+        heartbeat_thread.join()
+
+
+def run_worker() -> None:
+    queue = get_task_queue()
+    if queue is None:
+        raise SystemExit("יש להגדיר TASK_QUEUE_BACKEND (sqlite או redis) כדי להריץ worker")
+
+    apply_inference_profile()
+
+    worker_id = f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:8]}"
+    print(f"Worker {worker_id} התחיל")
+    last_requeue = 0.0
+
+    while True:
+        # כל worker בודק מדי פעם אם יש משימות של workers שקרסו ומחזיר אותן לתור
+        if time.monotonic() - last_requeue > HEARTBEAT_INTERVAL:
+            requeued = queue.requeue_stale()
+            if requeued:
+                print(f"הוחזרו {requeued} משימות של workers שהפסיקו לשלוח heartbeat")
+            last_requeue = time.monotonic()
+
+        task = queue.claim(worker_id)
+        if task is None:
+            time.sleep(IDLE_SLEEP)
+            continue
+
+        print(f"מעבד משימה {task['id']} ({task['kind']}, ניסיון {task['attempts']})")
+        process_task(queue, task, worker_id)
+
+
+if __name__ == "__main__":
+    run_worker()
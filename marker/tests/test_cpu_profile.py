@@ -0,0 +1,76 @@
+import pytest
+
+torch = pytest.importorskip("torch")
+
+from app.services import cpu_profile  # noqa: E402
+
+
+class FakePredictor:
+    def __init__(self, device=None, dtype=None):
+        self.model = torch.nn.Sequential(torch.nn.Linear(4, 4), torch.nn.ReLU(), torch.nn.Linear(4, 2))
+        self.dtype = dtype
+
+
+def test_available_cpus_respects_affinity_and_cgroup(monkeypatch):
+    monkeypatch.setattr(cpu_profile.os, "sched_getaffinity", lambda pid: set(range(8)), raising=False)
+    monkeypatch.setattr(cpu_profile, "_cgroup_cpu_limit", lambda: None)
+    assert cpu_profile.available_cpus() == 8
+
+    monkeypatch.setattr(cpu_profile, "_cgroup_cpu_limit", lambda: 2.5)
+    assert cpu_profile.available_cpus() == 3
+
+    monkeypatch.setattr(cpu_profile, "_cgroup_cpu_limit", lambda: 0.2)
+    assert cpu_profile.available_cpus() == 1
+
+
+def test_quantize_predictor_in_place():
+    model_dict = {"layout_model": FakePredictor()}
+    original = model_dict["layout_model"].model
+
+    assert cpu_profile.quantize_predictor(model_dict, "layout_model")
+    # inplace=True - אותו אובייקט, בלי עותק נוסף בזיכרון
+    assert model_dict["layout_model"].model is original
+    assert not any(type(m) is torch.nn.Linear for m in original.modules())
+
+
+def test_quantize_predictor_skips_missing_model():
+    assert not cpu_profile.quantize_predictor({}, "layout_model")
+
+
+def test_restore_predictor_reloads_full_precision():
+    model_dict = {"layout_model": FakePredictor()}
+    cpu_profile.quantize_predictor(model_dict, "layout_model")
+
+    cpu_profile.restore_predictor(model_dict, "layout_model")
+
+    assert model_dict["layout_model"].dtype == torch.float32
+    assert any(type(m) is torch.nn.Linear for m in model_dict["layout_model"].model.modules())
+
+
+def test_failed_quantization_restores_full_precision(monkeypatch):
+    pytest.importorskip("marker")
+    from app.services import model_registry
+
+    def broken_quantize(*args, **kwargs):
+        raise RuntimeError("quantization failed")
+
+    monkeypatch.setattr(torch.ao.quantization, "quantize_dynamic", broken_quantize)
+    monkeypatch.setattr(model_registry, "QUANTIZATION_VALIDATION_FILE", "validation.pdf")
+    monkeypatch.setattr(model_registry, "QUANTIZED_MODELS", ["layout_model"])
+    monkeypatch.setattr(model_registry, "_validation_text", lambda model_dict: "reference")
+    model_dict = {"layout_model": FakePredictor()}
+    original = model_dict["layout_model"]
+
+    model_dict = model_registry._quantize_validated(model_dict)
+
+    assert model_dict["layout_model"] is not original
+    assert model_dict["layout_model"].dtype == torch.float32
+
+
+def test_quantized_models_lists_int8_models():
+    model_dict = {"layout_model": FakePredictor(), "recognition_model": FakePredictor()}
+    assert cpu_profile.quantized_models(model_dict) == []
+
+    cpu_profile.quantize_predictor(model_dict, "recognition_model")
+
+    assert cpu_profile.quantized_models(model_dict) == ["recognition_model"]
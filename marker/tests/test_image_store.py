@@ -0,0 +1,73 @@
+import io
+import os
+import zipfile
+
+import pytest
+
+from app.services import image_store
+
+
+class FakeImage:
+    """תחליף לתמונת PIL - שומר את התוכן שלו כבייטים"""
+
+    mode = "RGB"
+
+    def __init__(self, data: bytes):
+        self.data = data
+
+    def save(self, buffer, format):
+        buffer.write(format.encode() + b":" + self.data)
+
+
+@pytest.fixture
+def stores(tmp_path, monkeypatch):
+    monkeypatch.setattr(image_store, "IMAGE_STORE_DIR", str(tmp_path / "images"))
+    monkeypatch.setattr(image_store, "IMAGE_BUNDLE_DIR", str(tmp_path / "bundles"))
+    return tmp_path
+
+
+def test_json_output_rejects_image_extraction():
+    image_store.validate_image_policy("none", "json")
+    image_store.validate_image_policy("refs", "markdown")
+    for policy in ("refs", "inline"):
+        with pytest.raises(ValueError):
+            image_store.validate_image_policy(policy, "json")
+    with pytest.raises(ValueError):
+        image_store.validate_image_policy("embed", "markdown")
+
+
+def test_refs_are_content_addressed_and_public(stores):
+    text = "![](_page_0_Picture_1.jpeg) ![](_page_1_Picture_2.jpeg)"
+    images = {
+        "_page_0_Picture_1.jpeg": FakeImage(b"same"),
+        "_page_1_Picture_2.jpeg": FakeImage(b"same"),
+    }
+
+    text = image_store.store_images(text, images, "refs")
+
+    stored = os.listdir(stores / "images")
+    assert len(stored) == 1
+    assert text.count(f"{image_store.IMAGE_BASE_URL}/{stored[0]}") == 2
+    assert image_store.get_image_path(stored[0])
+
+
+def test_inline_images_only_go_to_the_bundle(stores):
+    bundle_dir = image_store.create_bundle_dir()
+    text = image_store.store_images("![](_page_0_Picture_1.jpeg)", {
+        "_page_0_Picture_1.jpeg": FakeImage(b"pixels"),
+    }, "inline", bundle_dir)
+
+    # התמונה לא נכתבה לאחסון הציבורי ולא נגישה דרך /documents/images
+    assert not os.path.exists(stores / "images")
+    (image_name,) = os.listdir(bundle_dir)
+    with pytest.raises(FileNotFoundError):
+        image_store.get_image_path(image_name)
+
+    bundle = zipfile.ZipFile(io.BytesIO(image_store.build_bundle(text, "markdown", "doc", bundle_dir)))
+    assert sorted(bundle.namelist()) == ["doc.md", f"images/{image_name}"]
+    assert bundle.read("doc.md").decode() == f"![](images/{image_name})"
+
+
+def test_inline_requires_bundle_dir(stores):
+    with pytest.raises(ValueError):
+        image_store.store_images("x", {"a.png": FakeImage(b"x")}, "inline")
@@ -0,0 +1,108 @@
+import subprocess
+import sys
+
+import pytest
+
+from app.services import render_settings
+from app.services.render_settings import (
+    ADAPTIVE_DPI_LEVELS,
+    DEFAULT_DPI,
+    SMALL_FONT_DPI,
+    is_clean_page,
+    parse_dpi,
+    parse_languages,
+    pick_adaptive_dpi,
+)
+
+
+def test_parse_languages():
+    assert parse_languages("he, EN") == ["he", "en"]
+    assert parse_languages("") is None
+    with pytest.raises(ValueError):
+        parse_languages("hebrew!")
+
+
+def test_parse_languages_rejects_codes_unknown_to_surya(monkeypatch):
+    monkeypatch.setattr(render_settings, "_supported_languages", {"he", "en"})
+    assert parse_languages("he,en") == ["he", "en"]
+    with pytest.raises(ValueError):
+        parse_languages("heb")
+
+
+def test_supported_ocr_languages_does_not_import_torch():
+    pytest.importorskip("surya")
+    code = (
+        "import sys\n"
+        "from app.services.render_settings import supported_ocr_languages\n"
+        "assert {'he', 'en'} <= supported_ocr_languages()\n"
+        "assert 'torch' not in sys.modules\n"
+    )
+    subprocess.run([sys.executable, "-c", code], check=True)
+
+
+def test_parse_dpi():
+    assert parse_dpi(None) is None
+    assert parse_dpi("adaptive") == "adaptive"
+    assert parse_dpi("150") == 150
+    for value in ("10", "1000", "abc"):
+        with pytest.raises(ValueError):
+            parse_dpi(value)
+
+
+def test_clean_page():
+    assert is_clean_page(char_count=2000, bad_char_count=3, image_coverage=0.1)
+    # סריקה: תמונה מכסה את רוב העמוד
+    assert not is_clean_page(char_count=2000, bad_char_count=0, image_coverage=0.9)
+    # שכבת טקסט פגומה או כמעט ריקה
+    assert not is_clean_page(char_count=2000, bad_char_count=500, image_coverage=0.0)
+    assert not is_clean_page(char_count=20, bad_char_count=0, image_coverage=0.0)
+
+
+def test_small_font_raises_dpi():
+    assert pick_adaptive_dpi(842, median_font_size=6, clean=True) == SMALL_FONT_DPI
+
+
+def test_only_large_clean_pages_lower_dpi():
+    assert pick_adaptive_dpi(842, median_font_size=11, clean=True) == DEFAULT_DPI
+    assert pick_adaptive_dpi(1191, median_font_size=11, clean=False) == DEFAULT_DPI
+    assert pick_adaptive_dpi(1191, median_font_size=11, clean=True) < DEFAULT_DPI
+
+
+@pytest.mark.parametrize("long_side", [850, 900, 1000, 1191, 1684, 2384, 5000])
+def test_adaptive_dpi_snaps_to_levels(long_side):
+    assert pick_adaptive_dpi(long_side, median_font_size=11, clean=True) in ADAPTIVE_DPI_LEVELS
+    assert pick_adaptive_dpi(long_side, median_font_size=None, clean=False) in ADAPTIVE_DPI_LEVELS
+
+
+def test_installed_marker_reads_ocr_settings():
+    pytest.importorskip("marker")
+    from marker.builders.document import DocumentBuilder
+    from marker.builders.ocr import OcrBuilder
+    from marker.config.parser import ConfigParser
+
+    from app.services.model_registry import check_config_keys
+
+    check_config_keys("languages", "highres_image_dpi")
+    config = ConfigParser({"output_format": "markdown", "languages": "he,en", "highres_image_dpi": 144}).generate_config_dict()
+    assert OcrBuilder(None, config).languages == ["he", "en"]
+    assert DocumentBuilder(config).highres_image_dpi == 144
+    with pytest.raises(ValueError):
+        check_config_keys("not_a_marker_option")
+
+
+def test_converter_does_not_write_to_shared_model_dict(monkeypatch):
+    pytest.importorskip("marker")
+    import marker.converters
+    from app.services import model_registry
+
+    # בניית converter מורידה גופן לרינדור - לא נחוץ לבדיקה
+    monkeypatch.setattr(marker.converters, "download_font", lambda: None)
+    names = ["layout_model", "texify_model", "recognition_model", "table_rec_model",
+             "detection_model", "inline_detection_model", "ocr_error_model"]
+    shared = {name: object() for name in names}
+    monkeypatch.setattr(model_registry, "_model_dicts", {"default": shared})
+    monkeypatch.setattr(model_registry, "_converters", model_registry.OrderedDict())
+
+    model_registry.get_converter({"output_format": "markdown"}, profile="default")
+
+    assert "llm_service" not in shared
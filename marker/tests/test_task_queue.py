@@ -0,0 +1,269 @@
+import asyncio
+import os
+import subprocess
+import sys
+import time
+
+import pytest
+
+from app.services import task_queue
+from app.services.task_queue import (
+    STATUS_DONE,
+    STATUS_FAILED,
+    STATUS_PENDING,
+    STATUS_RUNNING,
+    RedisTaskQueue,
+    SQLiteTaskQueue,
+    TaskQueue,
+)
+
+
+@pytest.fixture(params=["sqlite", "redis"])
+def queue(request, tmp_path):
+    if request.param == "sqlite":
+        return SQLiteTaskQueue(str(tmp_path / "tasks.db"))
+    fakeredis = pytest.importorskip("fakeredis")
+    return RedisTaskQueue(client=fakeredis.FakeRedis(decode_responses=True))
+
+
+def expire_heartbeats(monkeypatch):
+    # כל heartbeat שכבר נשלח נחשב ישן
+    monkeypatch.setattr(task_queue, "HEARTBEAT_TIMEOUT", -1)
+
+
+def test_task_queue_is_abstract():
+    with pytest.raises(TypeError):
+        TaskQueue()
+
+
+def test_claim_and_complete(queue):
+    task_id = queue.enqueue("ocr", {"file_path": "/tmp/a.pdf"})
+
+    task = queue.claim("w1")
+    assert task["id"] == task_id
+    assert task["status"] == STATUS_RUNNING
+    assert task["attempts"] == 1
+    assert task["params"]["file_path"] == "/tmp/a.pdf"
+    assert queue.claim("w2") is None
+
+    assert queue.heartbeat(task_id, "w1")
+    assert queue.complete(task_id, "w1", "/tmp/a.out")
+    task = queue.get(task_id)
+    assert task["status"] == STATUS_DONE
+    assert task["result_path"] == "/tmp/a.out"
+    assert task["params"] == {}
+
+    queue.delete(task_id)
+    assert queue.get(task_id) is None
+
+
+def test_fail(queue):
+    task_id = queue.enqueue("standard", {})
+    queue.claim("w1")
+    assert queue.fail(task_id, "w1", "boom")
+    task = queue.get(task_id)
+    assert task["status"] == STATUS_FAILED
+    assert task["error"] == "boom"
+
+
+def test_only_owner_can_update(queue):
+    task_id = queue.enqueue("standard", {})
+    queue.claim("w1")
+
+    assert not queue.heartbeat(task_id, "w2")
+    assert not queue.complete(task_id, "w2", "/tmp/x.out")
+    assert not queue.fail(task_id, "w2", "boom")
+    assert queue.get(task_id)["status"] == STATUS_RUNNING
+
+
+def test_fresh_heartbeat_is_not_requeued(queue):
+    task_id = queue.enqueue("standard", {})
+    queue.claim("w1")
+    assert queue.requeue_stale() == 0
+    assert queue.get(task_id)["status"] == STATUS_RUNNING
+
+
+def test_stale_task_is_requeued_to_another_worker(queue, monkeypatch):
+    task_id = queue.enqueue("standard", {})
+    queue.claim("w1")
+
+    expire_heartbeats(monkeypatch)
+    assert queue.requeue_stale() == 1
+    assert queue.get(task_id)["status"] == STATUS_PENDING
+
+    task = queue.claim("w2")
+    assert task["id"] == task_id
+    assert task["attempts"] == 2
+
+    # ה-worker שנתקע לא יכול לשלוח heartbeat או לסיים משימה שעברה ל-worker אחר
+    assert not queue.heartbeat(task_id, "w1")
+    assert not queue.complete(task_id, "w1", "/tmp/stale.out")
+    assert queue.complete(task_id, "w2", "/tmp/w2.out")
+    assert queue.get(task_id)["result_path"] == "/tmp/w2.out"
+
+
+def test_max_attempts_marks_failed(queue, monkeypatch):
+    monkeypatch.setattr(task_queue, "MAX_ATTEMPTS", 2)
+    expire_heartbeats(monkeypatch)
+    task_id = queue.enqueue("standard", {})
+
+    queue.claim("w1")
+    assert queue.requeue_stale() == 1
+    queue.claim("w2")
+    assert queue.requeue_stale() == 1
+
+    task = queue.get(task_id)
+    assert task["status"] == STATUS_FAILED
+    assert queue.claim("w3") is None
+    # worker שנתקע וממשיך אחרי שהמשימה נכשלה לא מחזיר אותה למצב done
+    assert not queue.complete(task_id, "w2", "/tmp/late.out")
+    assert queue.get(task_id)["status"] == STATUS_FAILED
+
+
+def test_cancel_pending_task_is_not_claimed(queue):
+    task_id = queue.enqueue("standard", {})
+    assert queue.cancel(task_id, "cancelled")
+    assert queue.get(task_id)["status"] == STATUS_FAILED
+    assert queue.claim("w1") is None
+
+
+def test_cancel_running_task(queue):
+    task_id = queue.enqueue("standard", {})
+    queue.claim("w1")
+    assert queue.cancel(task_id, "cancelled")
+    assert not queue.complete(task_id, "w1", "/tmp/a.out")
+    assert not queue.cancel(task_id, "cancelled again")
+
+
+def test_redis_task_stuck_mid_claim_is_requeued(monkeypatch):
+    fakeredis = pytest.importorskip("fakeredis")
+    queue = RedisTaskQueue(client=fakeredis.FakeRedis(decode_responses=True))
+    task_id = queue.enqueue("standard", {})
+
+    # ה-worker קרס באמצע claim: המשימה עברה לרשימת הרצים אבל לא סומנה כרצה
+    queue.client.rpoplpush(queue.PENDING_KEY, queue.RUNNING_KEY)
+    assert queue.requeue_stale() == 0
+    assert queue.client.llen(queue.PENDING_KEY) == 0
+
+    expire_heartbeats(monkeypatch)
+    assert queue.requeue_stale() == 1
+    assert queue.client.lrange(queue.RUNNING_KEY, 0, -1) == []
+
+    task = queue.claim("w2")
+    assert task["id"] == task_id
+    assert task["worker_id"] == "w2"
+    assert "claimed_at" not in task
+
+
+def test_redis_stalled_claim_does_not_take_requeued_task(monkeypatch):
+    fakeredis = pytest.importorskip("fakeredis")
+    queue = RedisTaskQueue(client=fakeredis.FakeRedis(decode_responses=True))
+    task_id = queue.enqueue("standard", {})
+    queue.client.rpoplpush(queue.PENDING_KEY, queue.RUNNING_KEY)
+    expire_heartbeats(monkeypatch)
+    queue.requeue_stale()
+    queue.requeue_stale()
+
+    # ה-worker שנתקע ממשיך את ה-claim אחרי שהמשימה כבר חזרה לתור - הוא לא מקבל אותה
+    popped = iter([task_id])
+    monkeypatch.setattr(queue.client, "rpoplpush", lambda src, dst: next(popped, None))
+    assert queue.claim("w1") is None
+    assert queue.get(task_id)["status"] == STATUS_PENDING
+    assert queue.client.lrange(queue.PENDING_KEY, 0, -1) == [task_id]
+
+
+def test_enqueue_and_wait_timeout_cancels_task(queue, tmp_path, monkeypatch):
+    monkeypatch.setattr(task_queue, "TASK_STORAGE_DIR", str(tmp_path / "storage"))
+    monkeypatch.setattr(task_queue, "TASK_WAIT_TIMEOUT", 0)
+    monkeypatch.setattr(task_queue, "TASK_POLL_INTERVAL", 0)
+    source = tmp_path / "doc.pdf"
+    source.write_bytes(b"%PDF")
+
+    with pytest.raises(TimeoutError):
+        asyncio.run(task_queue.enqueue_and_wait(queue, "standard", str(source)))
+
+    # המשימה בוטלה ונמחקה, ו-worker לא יקבל אותה
+    assert queue.claim("w1") is None
+    assert not list((tmp_path / "storage" / "inputs").iterdir())
+
+
+def test_enqueue_and_wait_returns_result(queue, tmp_path, monkeypatch):
+    monkeypatch.setattr(task_queue, "TASK_STORAGE_DIR", str(tmp_path / "storage"))
+    monkeypatch.setattr(task_queue, "TASK_POLL_INTERVAL", 0)
+    source = tmp_path / "doc.pdf"
+    source.write_bytes(b"%PDF")
+
+    async def worker():
+        while True:
+            task = queue.claim("w1")
+            if task:
+                result_path = task_queue.result_path_for(task["id"], "w1")
+                with open(result_path, "w", encoding="utf-8") as f:
+                    f.write("# converted")
+                queue.complete(task["id"], "w1", result_path)
+                return task["id"]
+            await asyncio.sleep(0)
+
+    async def run():
+        return await asyncio.gather(
+            task_queue.enqueue_and_wait(queue, "standard", str(source), output_format="markdown"),
+            worker(),
+        )
+
+    text, task_id = asyncio.run(run())
+    assert text == "# converted"
+    assert queue.get(task_id) is None
+
+
+def test_sqlite_uses_wal(tmp_path):
+    queue = SQLiteTaskQueue(str(tmp_path / "tasks.db"))
+    conn = queue._connect()
+    try:
+        assert conn.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+    finally:
+        conn.close()
+
+
+def test_enqueue_and_wait_does_not_block_event_loop(queue, tmp_path, monkeypatch):
+    monkeypatch.setattr(task_queue, "TASK_STORAGE_DIR", str(tmp_path / "storage"))
+    monkeypatch.setattr(task_queue, "TASK_WAIT_TIMEOUT", 0)
+    source = tmp_path / "doc.pdf"
+    source.write_bytes(b"%PDF")
+
+    # get איטי (למשל SQLite שממתין לנעילה של worker) לא עוצר בקשות אחרות
+    slow_get = queue.get
+
+    def get(task_id):
+        time.sleep(0.2)
+        return slow_get(task_id)
+
+    monkeypatch.setattr(queue, "get", get)
+    ticks = []
+
+    async def other_request():
+        for _ in range(5):
+            ticks.append(time.monotonic())
+            await asyncio.sleep(0.02)
+
+    async def run():
+        return await asyncio.gather(
+            other_request(),
+            task_queue.enqueue_and_wait(queue, "standard", str(source)),
+            return_exceptions=True,
+        )
+
+    results = asyncio.run(run())
+    assert isinstance(results[1], TimeoutError)
+    assert ticks[-1] - ticks[0] < 0.2
+
+
+def test_api_tier_with_queue_does_not_import_ml_stack(tmp_path):
+    pytest.importorskip("fastapi")
+    code = (
+        "import sys\n"
+        "import app.main\n"
+        "loaded = [m for m in ('torch', 'marker', 'surya') if m in sys.modules]\n"
+        "assert not loaded, loaded\n"
+    )
+    env = dict(os.environ, TASK_QUEUE_BACKEND="sqlite", TASK_STORAGE_DIR=str(tmp_path))
+    subprocess.run([sys.executable, "-c", code], check=True, env=env)